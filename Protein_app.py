@@ -1,10 +1,33 @@
+import time
+STARTUP_START = time.perf_counter() #for the startup report - taken before the slow imports below
+
 import customtkinter as ctk
-from Bio import Entrez #Biopython’s tool to connect to NCBI’s databases.
 import threading #lets us fetch data in the background so the app doesn’t freeze.
 import tkinter as tk
 from tkinter import messagebox, filedialog #dialog boxes (pop-ups and file save windows)
-import webbrowser #lets you open links in the default browser.
-import time
+import os
+import sys
+
+from ncbi_cache import EntrezCache, CacheMiss, normalize_term, MODE_NORMAL, MODE_CACHE_ONLY, MODE_REFRESH
+from ncbi_client import NCBIClient, record_length, record_organism
+from ncbi_scheduler import CancelToken, SearchCancelled
+from sequence_view import ChunkedRenderer, format_fasta, LINE_WIDTH
+from fasta_stream import FastaDownload, open_fasta_output, parse_fasta_text
+from search_trace import SearchTrace, TraceLog
+from suggestions import RemoteSuggester, phrase_key
+from session_store import SessionStore
+from ui_dispatch import UIDispatcher
+#Biopython (XML parsing) and NumPy (protein_analytics) are slow to import, so they are not imported here - a background thread
+#loads them once the window is up (warm_up), and they are imported where used in case a search gets there first
+
+STARTUP_BUDGET_MS = 1000 #target for launch -> window ready for input, the startup report says when it's over
+SUGGEST_DELAY_MS = 40 #pause in typing before the local suggestions are looked up (the lookup itself takes a few ms)
+REMOTE_SUGGEST_DELAY_MS = 600 #longer pause before asking NCBI for a spelling correction and hit count
+REMOTE_SUGGEST_INTERVAL = 2.0 #seconds between those NCBI lookups at most, so typing never floods NCBI
+REMOTE_SUGGEST_MIN_CHARS = 4
+SUGGESTION_ROWS = 6
+HISTORY_MENU_SIZE = 30 #most recent proteins listed in the History menu (every one of them stays recallable)
+WARM_UP_INTERVAL = 30 #seconds - typing in an entry re-warms the NCBI connection if the last warm up is older than this (NCBI drops idle connections)
 
 
 
@@ -19,7 +42,10 @@ ctk.set_default_color_theme("blue")
 #starting the class 
 class ProteinSearchApp: #this wraps all code into a class, keeping code organised - a class is a blueprint/template for creating objects(which contain data and functions to handle certain tasks like a software)
     def __init__(self): #this function is an intialiser (a special method), and is the blueprint for how a new object of that class should be set up when it's first created 
+        self.startup_marks = {"imports": self.elapsed_ms()} #ms since launch at each step of startup, for the startup report
         self.root = ctk.CTk() #this makes the main window
+        self.ui = UIDispatcher(self.root) #worker threads post their GUI updates here, they are run in one batch per frame
+        self.startup_marks["window"] = self.elapsed_ms()
         self.root.title("Protein Sequence Finder") #sets the top bar text
         self.root.geometry("1200x1000")
         self.root.minsize(1000, 850) #this prevents the window being squished smaller than this
@@ -27,8 +53,28 @@ class ProteinSearchApp: #this wraps all code into a class, keeping code organise
         #Variables
         self.current_sequence = "" #a placeholder for the FASTA sequence that will be outputted later
         self.current_info = "" #a placeholder for metadata like title, length, organism
+        self.current_analysis = None #(names, properties) of the sequences being shown, for the analysis table export
+        self.current_record = None #(accession, residues) of the sequence being shown
+        self.cache = EntrezCache() #local on-disk cache of NCBI responses so repeat searches don't go back to NCBI
+        self.client = NCBIClient(cache=self.cache) #every NCBI request goes through this (shared with batch_search.py)
+        self.trace_log = TraceLog() #per stage timings of every search, written to ~/.protein_app/search_trace.jsonl
+        self.current_token = None #CancelToken of the search that is running right now, None when idle
+        self.current_query = "" #normalized name of that search, so pressing enter twice doesn't start it twice
+        self.current_hits = [] #esummary records for every hit of the last search, shown in the hits list
+        self.session = SessionStore() #every protein shown this session, for the History menu - see session_store.py
+        self.history_labels = {} #History menu label -> accession
+        self.hit_buttons = []
+        self.last_warm_up = None #time.monotonic() of the last connection warm up
+        self.suggest_job = None #pending root.after ids of the debounced suggestion lookups
+        self.remote_suggest_job = None
+        self.suggestion_choice = None #row picked with the arrow keys, None when nothing is highlighted
+        self.suggesting_for = None #entry text the shown suggestions are for, None once they are hidden
+        self.remote_suggester = RemoteSuggester(self.remote_suggestion, interval=REMOTE_SUGGEST_INTERVAL)
 
         self.setup_ui() #calls another function that build the buttons, inputs and layouts
+        self.startup_marks["ui"] = self.elapsed_ms()
+        self.ui.start()
+        self.root.after_idle(self.startup_ready) #runs once the window has been drawn and the event loop is idle
 
 
 #1 BUILDING THE GUI - BUILD ALL THE FRAMES, BUTTONS, LABEL, INPUTS AND TEXT AREAS IN THE APP
@@ -93,7 +139,27 @@ class ProteinSearchApp: #this wraps all code into a class, keeping code organise
 
 
         #now pressing enter button to trigger search
-        self.protein_entry.bind("<Return>", lambda e: self.search_protein()) #the text input field is attached to an event handler (.bind()), which tells it to watch out for a certain event. ie pressing the enter/return button. the lambda function immediatley calls the self.search_protein() method to retrieve the protein sequence. the lambda e: is standard way to define a temp function that accepts the event object 'e' passed by the system
+        self.email_entry.bind("<Key>", lambda e: self.warm_up_connection()) #the user is about to search, get the connection to NCBI ready
+        self.protein_entry.bind("<Key>", lambda e: self.warm_up_connection())
+        self.protein_entry.bind("<KeyRelease>", self.protein_typed) #type-ahead suggestions
+        self.protein_entry.bind("<Down>", lambda e: self.move_suggestion(1))
+        self.protein_entry.bind("<Up>", lambda e: self.move_suggestion(-1))
+        self.protein_entry.bind("<Escape>", lambda e: self.hide_suggestions())
+        self.protein_entry.bind("<FocusOut>", lambda e: self.root.after(200, self.hide_suggestions)) #late enough for a click on a suggestion to land
+        self.protein_entry.bind("<Return>", lambda e: self.search_protein(self.suggestion_choice)) #the text input field is attached to an event handler (.bind()), which tells it to watch out for a certain event. ie pressing the enter/return button. the lambda function immediatley calls the self.search_protein() method to retrieve the protein sequence. the lambda e: is standard way to define a temp function that accepts the event object 'e' passed by the system
+
+        #type-ahead suggestions - a list that floats under the protein entry (placed, so nothing below it moves), with the rows
+        #made once and only relabelled while typing, then an NCBI row for the spelling correction / hit count
+        self.suggestion_frame = ctk.CTkFrame(self.root, corner_radius=6, border_width=1)
+        self.suggestion_rows = []
+        for i in range(SUGGESTION_ROWS):
+            row = ctk.CTkButton(self.suggestion_frame, text="", anchor="w", height=26, fg_color="transparent",
+                                command=lambda i=i: self.pick_suggestion(i))
+            self.suggestion_rows.append(row)
+        self.remote_row = ctk.CTkButton(self.suggestion_frame, text="", anchor="w", height=26, fg_color="transparent",
+                                        text_color="gray", command=lambda: self.pick_suggestion(SUGGESTION_ROWS))
+        self.local_suggestions = [] #texts of the local rows showing right now
+        self.suggestions_shown = [] #what each row showing right now searches for, the NCBI row (if any) last
 
         #now creating a clickable search button in case people don't press enter
         self.search_button = ctk.CTkButton( #the 'self.' makes it accessible by other methodsin the class
@@ -103,7 +169,39 @@ class ProteinSearchApp: #this wraps all code into a class, keeping code organise
             font=ctk.CTkFont(size=16, weight="bold"),
             command=self.search_protein #ACTION LINK - this tells the button what python function ot run when clicked
         )
-        self.search_button.pack(pady=(0,20))
+        self.search_button.pack(pady=(0,10))
+
+        #search options row - cache switch and how many hits to list
+        options_frame = ctk.CTkFrame(input_frame, fg_color="transparent")
+        options_frame.pack(pady=(0,20))
+
+        #cache switch - normal uses the local cache first, cache only never touches the network, refresh always re-downloads
+        self.cache_modes = {"Use Cache": MODE_NORMAL, "Cache Only": MODE_CACHE_ONLY, "Refresh": MODE_REFRESH}
+        self.cache_mode_button = ctk.CTkSegmentedButton(
+            options_frame,
+            values=list(self.cache_modes),
+            command=lambda choice: self.cache.set_mode(self.cache_modes[choice])
+        )
+        self.cache_mode_button.set("Use Cache")
+        self.cache_mode_button.pack(side="left", padx=(0,20))
+
+        #max hits - this is the retmax sent with esearch, all of the hits are listed in the results section
+        retmax_label = ctk.CTkLabel(options_frame, text="Max hits:")
+        retmax_label.pack(side="left", padx=(0,5))
+        self.retmax_menu = ctk.CTkOptionMenu(options_frame, values=["5", "10", "20", "50", "100"], width=80)
+        self.retmax_menu.set("10")
+        self.retmax_menu.pack(side="left")
+
+        #offline search - resolves the name with the local title index (every protein seen or imported before) instead of esearch
+        self.offline_switch = ctk.CTkCheckBox(options_frame, text="Offline search")
+        self.offline_switch.pack(side="left", padx=(20,0))
+
+        #import a local FASTA file (e.g. a Swiss-Prot dump) - sequences found in it are shown without downloading them
+        self.import_button = ctk.CTkButton(options_frame, text="Import Local FASTA", width=140, command=self.import_local_fasta)
+        self.import_button.pack(side="left", padx=(20,0))
+
+        self.latency_button = ctk.CTkButton(options_frame, text="Latency", width=80, command=self.show_latency)
+        self.latency_button.pack(side="left", padx=(10,0))
 
 
 
@@ -149,7 +247,6 @@ class ProteinSearchApp: #this wraps all code into a class, keeping code organise
         self.progress_bar = ctk.CTkProgressBar(main_frame)
         self.progress_bar.set(0)
         self.progress_bar.pack(fill="x", padx=20, pady=(0,10))
-        self.root.update()
         #self.progress_bar.pack_forget() # to hide the progress bar initially 
 
         self.status_label = ctk.CTkLabel(main_frame, text="", text_color="gray")
@@ -191,12 +288,59 @@ class ProteinSearchApp: #this wraps all code into a class, keeping code organise
             command=self.save_sequence  #i will create this method(basically function) later
         )
         self.save_button.pack(side="right", padx=5)
+
+
+        #now create an export button that downloads every hit of the search into one multi-FASTA file
+        self.export_button = ctk.CTkButton(
+            results_header,
+            text = "Export Hits",
+            width = 100,
+            command=self.export_hits
+        )
+        self.export_button.pack(side="right", padx=5)
+
+
+        #now create a button that saves the physicochemical properties of the shown sequences as a table
+        self.analysis_button = ctk.CTkButton(
+            results_header,
+            text = "Export Analysis",
+            width = 110,
+            command=self.export_analysis
+        )
+        self.analysis_button.pack(side="right", padx=5)
+
+
+        #now create a button that lists the fetched/imported sequences most similar to the one being shown
+        self.similar_button = ctk.CTkButton(
+            results_header,
+            text = "Find Similar",
+            width = 100,
+            command=self.find_similar
+        )
+        self.similar_button.pack(side="right", padx=5)
+
+
+        #now a menu of every protein shown this session - picking one shows it again straight from memory, no download
+        self.history_menu = ctk.CTkOptionMenu(
+            results_header,
+            values=["History"],
+            width=130,
+            command=lambda label: self.recall(self.history_labels.get(label))
+        )
+        self.history_menu.set("History")
+        self.history_menu.configure(state="disabled")
+        self.history_menu.pack(side="right", padx=5)
     
 
+        #now create the list of every hit from the search - clicking one loads its sequence (the top hit is loaded automatically)
+        self.hits_frame = ctk.CTkScrollableFrame(self.results_frame, height=110, label_text="Hits")
+        self.hits_frame.pack(fill="x", padx=15, pady=(0,10))
+
+
         #now create protein metadata box (like title, length of amino acid chain, organsim...)
         self.info_textbox = ctk.CTkTextbox(
             self.results_frame,
-            height=80,
+            height=130, #tall enough for the metadata plus the physicochemical summary
             font=ctk.CTkFont(family="Consolas", size=12)
         )
         self.info_textbox.pack(fill="x", padx=15, pady=(0,10))
@@ -207,14 +351,18 @@ class ProteinSearchApp: #this wraps all code into a class, keeping code organise
             self.results_frame,
             height=300, #to set a minimunm height, even when empty to make it visible on startup regardless of window size
             font=ctk.CTkFont(family="Consolas", size=11),
-            wrap="char" #this is a setting for a text box that determines how long lines of text are broke up - in this case, the text will break and move to the next line after any single character if the line runs out of space - as the DNA/Protein sequence wont have any natural gaps in it - instead of word wrap, which will wait for a whole word before moving to next line - this is done by the CHARacter
+            wrap="none" #the sequence is already laid out in fixed width lines of 60 residues (see sequence_view.py), so Tk doesn't need to work out any wrapping itself - that wrapping is what made huge sequences so slow to show
         )
         self.results_textbox.pack(fill="both", expand=True, padx=15, pady=(0,15)) #fill both means fill extra space in both the horizontal and vertical directions. Expand=True tells the textbox to absorb any extra space allocated to its parent frame, allowing the widget to grow if the user enlarges the application window
+        self.sequence_renderer = ChunkedRenderer(self.root, self.results_textbox) #draws big sequences a slice at a time so the window doesn't freeze
         
 
         #disable copy button and save button until data appears
         self.copy_button.configure(state="disabled")
         self.save_button.configure(state="disabled")
+        self.export_button.configure(state="disabled")
+        self.analysis_button.configure(state="disabled")
+        self.similar_button.configure(state="disabled")
 
 
         #footer
@@ -243,6 +391,103 @@ class ProteinSearchApp: #this wraps all code into a class, keeping code organise
         self.protein_entry.insert(0, protein_name) #which allows this to input the name of the protein into the protein entry box when the button is pressed 
 
 
+    #type-ahead - local suggestions after a short pause in typing, NCBI's spelling correction + hit count after a longer one
+    def protein_typed(self, event):
+        if event.keysym in ("Up", "Down", "Return", "KP_Enter", "Escape", "Tab", "Shift_L", "Shift_R", "Control_L", "Control_R"):
+            return
+        self.cancel_suggestion_lookups() #the rows shown stay up until the ones for the new text replace them
+        self.suggest_job = self.root.after(SUGGEST_DELAY_MS, self.update_suggestions)
+
+    def update_suggestions(self):
+        self.suggest_job = None
+        text = self.protein_entry.get()
+        self.show_suggestions([s["text"] for s in self.client.suggestions.suggest(text, limit=SUGGESTION_ROWS)])
+        self.suggesting_for = text
+        if len(phrase_key(text)) >= REMOTE_SUGGEST_MIN_CHARS and not self.offline_switch.get():
+            self.remote_suggest_job = self.root.after(REMOTE_SUGGEST_DELAY_MS, lambda: self.request_remote_suggestion(text))
+
+    def request_remote_suggestion(self, text):
+        self.remote_suggest_job = None
+        email = self.email_entry.get().strip()
+        if email and not self.client.email:
+            self.client.email = email
+        self.remote_suggester.request(text, lambda term, result: self.ui.post(lambda: self.show_remote_suggestion(term, result), key="remote suggestion"))
+
+    def remote_suggestion(self, term):
+        #runs on the suggester's thread - (corrected term, number of NCBI hits for it), both cached like any other lookup
+        corrected = self.client.espell(term)
+        return corrected, self.client.esearch_count(corrected)
+
+    def show_suggestions(self, texts, remote=None):
+        #texts are the local suggestions, remote is (text to search, label) for the NCBI row
+        for row in self.suggestion_rows + [self.remote_row]:
+            row.pack_forget()
+        for row, text in zip(self.suggestion_rows, texts):
+            row.configure(text=text)
+            row.pack(fill="x", padx=4, pady=1)
+        self.local_suggestions = list(texts)
+        self.suggestions_shown = list(texts)
+        if remote:
+            self.remote_row.configure(text=remote[1])
+            self.remote_row.pack(fill="x", padx=4, pady=1)
+            self.suggestions_shown.append(remote[0])
+        self.suggestion_choice = None
+        self.highlight_suggestion()
+        if self.suggestions_shown:
+            self.suggestion_frame.place(in_=self.protein_entry, x=0, rely=1.0, relwidth=1.0)
+            self.suggestion_frame.lift()
+        else:
+            self.suggestion_frame.place_forget()
+
+    def show_remote_suggestion(self, term, result):
+        if self.suggesting_for != term or self.protein_entry.get() != term:
+            return #typing has moved on, or the search has already started
+        corrected, count = result
+        if phrase_key(corrected) != phrase_key(term):
+            remote = (corrected, f"Did you mean: {corrected}  ({count:,} results on NCBI)")
+        elif count:
+            remote = (term, f"{count:,} results on NCBI")
+        else:
+            remote = (term, f"No NCBI results for '{term.strip()}' - check the spelling")
+        self.show_suggestions(self.local_suggestions, remote)
+
+    def cancel_suggestion_lookups(self):
+        for job in (self.suggest_job, self.remote_suggest_job):
+            if job:
+                self.root.after_cancel(job)
+        self.suggest_job = self.remote_suggest_job = None
+        self.remote_suggester.cancel()
+        self.suggesting_for = None
+
+    def hide_suggestions(self):
+        self.cancel_suggestion_lookups()
+        self.suggestion_frame.place_forget()
+        self.local_suggestions = []
+        self.suggestions_shown = []
+        self.suggestion_choice = None
+
+    def move_suggestion(self, step):
+        if not self.suggestions_shown:
+            return
+        if self.suggestion_choice is None:
+            self.suggestion_choice = 0 if step > 0 else len(self.suggestions_shown) - 1
+        else:
+            self.suggestion_choice = (self.suggestion_choice + step) % len(self.suggestions_shown)
+        self.highlight_suggestion()
+        return "break" #keep the cursor where it is
+
+    def highlight_suggestion(self):
+        rows = self.suggestion_rows[:len(self.local_suggestions)]
+        if len(self.suggestions_shown) > len(self.local_suggestions):
+            rows.append(self.remote_row)
+        for i, row in enumerate(rows):
+            row.configure(fg_color=("gray75", "gray30") if i == self.suggestion_choice else "transparent")
+
+    def pick_suggestion(self, index):
+        if index >= SUGGESTION_ROWS: #the NCBI row is always after the local ones
+            index = len(self.suggestions_shown) - 1
+        self.search_protein(index)
+
     def validate_inputs(self):
         #check if email and protein name are valid
         email = self.email_entry.get().strip() #this retrieves the email and strips out of any leading or tailing white space like spaces or tabs
@@ -262,25 +507,34 @@ class ProteinSearchApp: #this wraps all code into a class, keeping code organise
     #uses a series of independant if statements to check conditions one by one - if any condition is met, it immediately stops and shows an error
 
 
-    def search_protein(self):  #this is the method we used earlier and now we are actually making what it does
-        #start protein search (runs in background thread)
+    def search_protein(self, suggestion=None):  #this is the method we used earlier and now we are actually making what it does
+        #start protein search (runs in background thread) - suggestion is the index of a highlighted type-ahead row to search for instead
+        if suggestion is not None and suggestion < len(self.suggestions_shown):
+            self.protein_entry.delete(0, tk.END)
+            self.protein_entry.insert(0, self.suggestions_shown[suggestion])
+        self.hide_suggestions()
         if not self.validate_inputs(): #the function calls the self.validate_inputs method which checks the email and protein input fields - if any of the if statements in validate_inputs code block finds an error then returns false, if not then the operator flips it to True, so the if condition is met. 
             return #if the if condition is true(meaning the validation failed), this command exits the search_protein method
         #the if statement is designed to be True only when the validation failed(false) - due to the operator of not flipping it, so the code can execute the stop(return)
 
     #so this function is the primary method that controls the rest of the workflow - called when the user presses enter or clicks search button - this method was used earlier and now coding what it does now
 
-    #now make a disable button and show progress bar for when the search button/enter has been pressed
-        self.search_button.configure(state="disabled", text="Searching...") #disable the button so it can't be pressed again and change the text to searching...
-        self.progress_bar.pack(fill="x", padx=20, pady=(0,10)) #this actually displays the progress bar now which was hidden before
-        self.progress_bar.set(0) #this sets the initial value of the progress bar to 0 before it starts moving up
+        protein_name = self.protein_entry.get().strip()
+        token = self.start_task(normalize_term(protein_name)) #cancels any older search and turns the search button into a cancel button
+        if token is None:
+            return #the exact same search is already running (e.g. enter pressed twice) so let that one finish
         self.status_label.configure(text="Connecting to NCBI...") #this changes the text shown in the status label to show that, giving user immediate confirmation that the search is happening
 
     #now the code to clear all the old results - cleanup sequence before a new search begins
         self.info_textbox.delete("1.0", tk.END) #delete clears all metadata/accession number text in info_textbox - 1.0 refers to clearing from beginning of the text at line 1 - tk.END ensures the clearing occurs till the end of the text
+        self.sequence_renderer.cancel() #stop drawing the previous sequence if it is still going
         self.results_textbox.delete("1.0", tk.END) #same for clearing the sequence_textbox
+        self.show_hits([]) #empties the hits list
         self.copy_button.configure(state="disabled") #prevents user copying old or non-existent results
         self.save_button.configure(state="disabled") ##prevents user saving old or non-existent results
+        self.export_button.configure(state="disabled")
+        self.analysis_button.configure(state="disabled")
+        self.similar_button.configure(state="disabled")
 
     #this makes the code run in thread (run in the background so the UI doesn't freeze while waiting for NCBI)
         email = self.email_entry.get().strip()
@@ -288,56 +542,176 @@ class ProteinSearchApp: #this wraps all code into a class, keeping code organise
 
         search_thread = threading.Thread( #creates a new thread from pythons threading module - a thread is a parallel worker inside the programme
             target=self.perform_search, #this specifies the function the new thread should run - run the method self.perform_search which we will code later on to do the actual ncbi search
-            args=(email, protein_name), #this passes these arguments into the self.perform_search method as it needs this info to carry out the ncbi search
+            args=(email, protein_name, token, int(self.retmax_menu.get()), bool(self.offline_switch.get())), #this passes these arguments into the self.perform_search method as it needs this info to carry out the ncbi search
             daemon=True #this marks this thread as a daemon thread, so the programm won't wait for this thread to finish when the main application is closed, it will shut down too contemporaneously
         )
         search_thread.start() #this immediately starts the thread, causing self.perform_search function to run in the background, allowing the main UI to remain responsive 
 
 
+    def start_task(self, task_key):
+        #called before every search or hit load - cancels whatever is running (the user changed their mind) and makes a new CancelToken
+        #returns None if the exact same task is already running, so it isn't started twice
+        if self.current_token is not None and task_key == self.current_query:
+            return None
+        if self.current_token is not None:
+            self.current_token.cancel() #the older search stops at its next stage and its results are dropped
+        self.current_token = CancelToken()
+        self.current_query = task_key
+
+        #turn the search button into a cancel button and show the progress bar
+        self.search_button.configure(text="Cancel Search", command=self.cancel_search)
+        self.progress_bar.pack(fill="x", padx=20, pady=(0,10)) #this actually displays the progress bar now which was hidden before
+        self.progress_bar.set(0) #this sets the initial value of the progress bar to 0 before it starts moving up
+        return self.current_token
+
+
+    def select_hit(self, index):
+        #called when a hit in the hits list is clicked - loads that hit's sequence in the background (instant if it was already fetched)
+        record = self.current_hits[index]
+        if self.recall(str(record.get("AccessionVersion", ""))): #already shown this session
+            self.highlight_hit(index)
+            return
+        uid = str(record.get("Id"))
+        token = self.start_task(f"uid:{uid}")
+        if token is None:
+            return
+        self.highlight_hit(index)
+        self.status_label.configure(text=f"Loading {record.get('AccessionVersion', uid)}...")
+        threading.Thread(target=self.load_hit, args=(record, token), daemon=True).start()
+
+
 
 
 
     #3 - CREATING CODE FOR THE NCBI SEARCH (BACKGROUND THREAD)
-    def perform_search(self, email, protein_name): #it accepts the application instance 'self' as an argument as well as the other 2
+    def perform_search(self, email, protein_name, token, retmax=10, offline=False): #it accepts the application instance 'self' as an argument as well as the others - token is this search's CancelToken, retmax is how many hits to list, offline uses the local title index instead of esearch
+        trace = SearchTrace(protein_name, "offline search" if offline else "search") #times every stage, see search_trace.py
         try: #try is used to start the try block as it ensures that if any network communication errors occur, it wont crask straightaway  
-            Entrez.email = email #tell NCBI who is using it, needed for the NCBI API
+            self.client.email = email #tell NCBI who is using it, needed for the NCBI API
 
             #step one = search
-            self.root.after(0, lambda: self.progress_bar.set(0.2)) #because this is running in a thread, the method cannot directly access the GUI widgets, so self.root.after schedules an update to run 0ms on the main GUI thread, pushing the progress bar to 20%
-            self.root.after(0, lambda: self.status_label.configure(text="Searching protein database..."))#this schedules an update to change the status label text, giving the user live feedback
-            handle = Entrez.esearch(db="protein", term = protein_name, retmax=5) #start of the actual NCBI request
-            search_results = Entrez.read(handle)
-            handle.close()
-            id_list = search_results["IdList"]
+            if offline:
+                #the local title index gives esummary style records straight away, so step two isn't needed
+                with trace.stage("esearch"):
+                    summaries = self.client.local_search(protein_name, retmax=retmax)
+                id_list = [record["Id"] for record in summaries]
+            else:
+                self.after_search(token, lambda: self.status_label.configure(text=self.queued_status("Searching protein database...")), key="status")#this schedules an update to change the status label text, giving the user live feedback
+                with trace.stage("esearch", self.byte_progress(token, 0.0, 0.1)) as stage: #the progress bar follows the bytes of the reply as they arrive
+                    id_list = self.client.esearch(protein_name, retmax=retmax, token=token, progress=stage.progress) #the cache answers straight away if this term was searched recently, otherwise the client asks NCBI and stores the reply
+            self.after_search(token, lambda: self.progress_bar.set(0.1), key="progress")
             
             #another Guard Clause 
             if not id_list: #this checks if id_list is empty - if it is empty. then 'no id_list' condition is true
-                self.root.after(0, lambda: self.show_no_results(protein_name)) #if no ids were found, it schedules a call to the self.show_no_results method to run on the main thread to show the reader an error message 
+                self.trace_log.record(trace, "no results")
+                self.after_search(token, lambda: self.show_no_results(protein_name)) #if no ids were found, it schedules a call to the self.show_no_results method to run on the main thread to show the reader an error message 
                 return #immediately exits the perform search method, stopping the background thread as no data to retrieve in next steps
             
 
-            #step two = get summary
-            self.root.after(0, lambda: self.progress_bar.set(0.5)) #this technique updates the GUI from a background thread - only main thread can modify any GUI widget, no side threats or else crash. self.root = main window application, after(0), makes it run 0ms after (it tells the main thread, when you get a chance, run this function next). the lambda function wraps up the unsafe code and scheduling it with 'after' to just after, changing the progress bar from 20% to 50%
-            self.root.after(0, lambda: self.status_label.configure(text="Retrieving sequence information..."))
-            handle = Entrez.esummary(db="protein", id=id_list[0])
-        
-            summary = Entrez.read(handle)
-            handle.close()
+            #step two = get the summaries of every hit in one request and list them
+            if not offline:
+                self.after_search(token, lambda: self.status_label.configure(text=self.queued_status("Retrieving sequence information...")), key="status")
+                token.check() #stop here if a newer search has replaced this one
+                with trace.stage("esummary", self.byte_progress(token, 0.1, 0.2)) as stage:
+                    summaries = self.client.esummary(id_list, token=token, progress=stage.progress)
+            self.after_search(token, lambda: self.progress_bar.set(0.2), key="progress") #this technique updates the GUI from a background thread - only main thread can modify any GUI widget, no side threats or else crash. after_search hands the update to self.ui, which runs it on the main thread at the next frame
+            self.after_search(token, lambda: self.show_hits(summaries))
+
+            #step 3 = fetch the top hit's FASTA sequence while the user looks through the hits list - the bulk of the bar, since this is the big download
+            self.after_search(token, lambda: self.status_label.configure(text=self.queued_status("Downloading sequence...")), key="status")
+            token.check()
+            with trace.stage("efetch", self.byte_progress(token, 0.2, 0.95)) as stage:
+                sequence = self.fetch_sequence(summaries[0], token, stage.progress) #checks the session history and imported local FASTA files before asking NCBI
+
+            #step 4 = parse the FASTA and work out its properties here, off the main thread, then display results
+            with trace.stage("parse"):
+                analysis = self.analyse_fasta(sequence)
+            self.after_search(token, lambda: self.progress_bar.set(1.0), key="progress")
+            self.after_search(token, lambda: self.display_results(summaries[0], sequence, analysis, trace)) #this lambda function is telling the main application thread to display the search results immediately. this method will update the GUIs with the summary info and the sequence
+
+        except SearchCancelled: #a newer search (or the cancel button) replaced this one, nothing to show
+            self.trace_log.record(trace, "cancelled")
+            return
+        except CacheMiss as e: #only happens in cache only mode when this search has never been done before
+            self.trace_log.record(trace, "cache miss")
+            error_msg = f"{str(e)}. Switch to 'Use Cache' to download it from NCBI."
+            self.after_search(token, lambda: self.show_error(error_msg))
+        except Exception as e: #error handler - catch errors from the preceding 'try' block like a network failure, the programme jumps here and teh specific error message is captured in the variable - the 'e' contains the error message given by NCBI which will get displayed
+            self.trace_log.record(trace, "error")
+            error_msg = f"Error searching for protein: {str(e)}" #appends this error message with the error message given by NCBI
+            self.after_search(token, lambda: self.show_error(error_msg)) #this calls the method - self.show_error passing the actual error_msg - the show_error method will then update the GUI with the erro_msg
 
-            #step 3 = fetch FASTA sequence
-            self.root.after(0, lambda: self.progress_bar.set(0.8))
-            self.root.after(0, lambda: self.status_label.configure(text="Downloading sequence..."))
-            handle=Entrez.efetch(db="protein", id=id_list[0], rettype="fasta", retmode="text")
-            sequence= handle.read()
-            handle.close()
 
-            #step 4 = display results
-            self.root.after(0, lambda: self.progress_bar.set(1.0))
-            self.root.after(0, lambda: self.display_results(summary, sequence)) #this lambda function is telling the main application thread to display the search results immediately. this method will update the GUIs with the summary info and the sequence
 
-        except Exception as e: #error handler - catch errors from the preceding 'try' block like a network failure, the programme jumps here and teh specific error message is captured in the variable - the 'e' contains the error message given by NCBI which will get displayed
-            error_msg = f"Error searching for protein: {str(e)}" #appends this error message with the error message given by NCBI
-            self.root.after(0, lambda: self.show_error(error_msg)) #this calls the method - self.show_error passing the actual error_msg - the show_error method will then update the GUI with the erro_msg
+
+    def load_hit(self, record, token):
+        #background thread for select_hit - same error handling and tracing as perform_search
+        trace = SearchTrace(str(record.get("AccessionVersion", record.get("Id"))), "hit")
+        try:
+            with trace.stage("efetch", self.byte_progress(token, 0.0, 0.95)) as stage:
+                sequence = self.fetch_sequence(record, token, stage.progress)
+            with trace.stage("parse"):
+                analysis = self.analyse_fasta(sequence)
+            self.after_search(token, lambda: self.progress_bar.set(1.0), key="progress")
+            self.after_search(token, lambda: self.display_results(record, sequence, analysis, trace))
+        except SearchCancelled:
+            self.trace_log.record(trace, "cancelled")
+            return
+        except CacheMiss as e:
+            self.trace_log.record(trace, "cache miss")
+            error_msg = f"{str(e)}. Switch to 'Use Cache' to download it from NCBI."
+            self.after_search(token, lambda: self.show_error(error_msg))
+        except Exception as e:
+            self.trace_log.record(trace, "error")
+            error_msg = f"Error loading sequence: {str(e)}"
+            self.after_search(token, lambda: self.show_error(error_msg))
+
+    def fetch_sequence(self, record, token, progress):
+        #FASTA for a hit - from the session history if it was shown before, otherwise through the client (local files, cache, NCBI)
+        entry = self.session.get(str(record.get("AccessionVersion", "")))
+        if entry is not None:
+            return self.session.fasta(entry)
+        return self.client.fetch_fasta(record, token=token, progress=progress)
+
+    def analyse_fasta(self, sequence):
+        #runs on the search thread - physicochemical properties of every record in the FASTA (one NumPy pass)
+        #returns (names, properties, residues of the first record), or None if there are no records
+        records = parse_fasta_text(sequence)
+        if not records:
+            return None
+        from protein_analytics import analyze_batch
+        names = [header.split(None, 1)[0] if header.strip() else "" for header, _ in records]
+        return names, analyze_batch([residues for _, residues in records]), records[0][1]
+
+    def byte_progress(self, token, low, high):
+        #progress(received, total) callback for a download that moves the progress bar from low to high as the bytes arrive
+        #without a Content-Length the total isn't known, so the bar creeps towards high instead
+        shown = [low]
+
+        def progress(received, total):
+            fraction = received / total if total else received / (received + 256 * 1024)
+            value = low + (high - low) * min(fraction, 1.0)
+            if value - shown[0] >= 0.01: #no need to flood the main loop with an update per chunk
+                shown[0] = value
+                self.after_search(token, lambda: self.progress_bar.set(value), key="progress")
+        return progress
+
+    def after_search(self, token, callback, key=None):
+        #schedules a GUI update from the search thread, but only runs it if this search is still the current one - stale results from a replaced search are dropped
+        #key ("status", "progress") marks updates where only the latest matters, an older one still waiting for its frame is skipped
+        self.ui.post(lambda: callback() if token is self.current_token else None, key=key and (key, token))
+
+    def cancel_search(self):
+        #called by the search button while a search is running
+        if self.current_token is not None:
+            self.current_token.cancel()
+        self.status_label.configure(text="Search cancelled.")
+        self.reset_search_button()
+
+    def queued_status(self, text):
+        #adds the scheduler's queue depth to a status message, so the user can see when a search is waiting behind others for its turn with NCBI
+        depth = self.client.scheduler.queue_depth
+        return f"{text} ({depth} requests queued)" if depth else text
 
 
 
@@ -356,44 +730,123 @@ class ProteinSearchApp: #this wraps all code into a class, keeping code organise
         messagebox.showerror("Search Error", error_msg) #this opens a modal pop up window on the screen, with title "search error" and the body displays the error message - ensures the user notices the failure immediately
         self.reset_search_button()
 
-    def display_results(self, summary, sequence):
-        #shows results in the UI - NOT ERROR HANDLING
+    def show_hits(self, summaries):
+        #fills the hits list with one button per esummary record (an empty list just clears it)
+        for button in self.hit_buttons:
+            button.destroy()
+        self.current_hits = list(summaries)
+        self.hit_buttons = []
+        for i, record in enumerate(self.current_hits):
+            button = ctk.CTkButton(
+                self.hits_frame,
+                text=f"{record.get('AccessionVersion', record.get('Id'))}   {record.get('Title', 'N/A')}   ({record_length(record, '?')} aa)" + self.similarity_text(record),
+                anchor="w",
+                height=26,
+                fg_color="transparent",
+                command=lambda index=i: self.select_hit(index) #same trick as the example buttons, index=i remembers which hit this button is for
+            )
+            button.pack(fill="x", pady=1)
+            self.hit_buttons.append(button)
+        if self.hit_buttons:
+            self.highlight_hit(0) #the top hit is the one being loaded first
+        self.export_button.configure(state="normal" if self.hit_buttons else "disabled")
+
+    def similarity_text(self, record):
+        #extra hit list text for results of find_similar
+        if "Similarity" not in record:
+            return ""
+        if "AlignmentScore" in record:
+            return f"   similarity {record['Similarity']:.2f}, alignment score {record['AlignmentScore']}"
+        return f"   similarity {record['Similarity']:.2f}"
+
+    def highlight_hit(self, index):
+        for i, button in enumerate(self.hit_buttons):
+            button.configure(fg_color=("gray75", "gray30") if i == index else "transparent")
+
+    def display_results(self, record, sequence, analysis, trace):
+        #shows results in the UI - NOT ERROR HANDLING - record is the esummary record of the hit being shown, analysis comes from
+        #analyse_fasta and trace is the search's SearchTrace, which is finished and logged once the sequence has been drawn
 
         #store values
-          # Clear old content
-        self.info_textbox.delete("1.0", tk.END)
-        self.results_textbox.delete("1.0", tk.END)
-
-        record = summary[0]
         self.current_sequence = sequence
-        self.current_info = f"Title: {record.get('Title', 'N/A')}\nOrganism: {record.get('Organism', 'N/A')}\nLength: {record.get('Length', 'N/A')} aa\nAccession: {record.get('AccessionVersion', 'N/A')}"
-    # Show summary information
-        self.info_textbox.insert(
-            tk.END,
-            f"Title: {record.get('Title', 'N/A')}\n"
-            f"Organism: {record.get('Organism', 'N/A')}\n"
-            f"Length: {record.get('Length', 'N/A')} aa\n"
-            f"Accession: {record.get('AccessionVersion', 'N/A')}\n"
+        self.current_info = f"Title: {record.get('Title', 'N/A')}\nOrganism: {record_organism(record)}\nLength: {record_length(record, 'N/A')} aa\nAccession: {record.get('AccessionVersion', 'N/A')}"
+
+        #physicochemical properties (worked out on the search thread by analyse_fasta), the first record is summarised in the info box
+        if analysis:
+            from protein_analytics import summary_text
+            names, properties, residues = analysis
+            self.current_analysis = (names, properties)
+            self.current_record = (str(record.get("AccessionVersion", "")), residues) #accession + residues, for find_similar
+            self.current_info += "\n" + summary_text({name: values[0].item() for name, values in properties.items()})
+            if trace.kind != "recall":
+                self.remember(record, sequence, residues)
+        else:
+            self.current_analysis = None
+            self.current_record = None
+
+        #show summary information (replacing whatever was there)
+        self.info_textbox.delete("1.0", tk.END)
+        self.info_textbox.insert("1.0", self.current_info)
+
+        #show the sequence - formatted into blocks and drawn a slice at a time, so even megabytes of FASTA don't freeze the window
+        self.status_label.configure(text="Displaying sequence...")
+        render_stage = trace.begin("render")
+        expected_lines = max(1, len(sequence) // LINE_WIDTH) #roughly, headers and blank lines aside
+
+        def rendered():
+            render_stage.finish()
+            entry = self.trace_log.record(trace, "ok")
+            if trace.kind == "recall":
+                self.status_label.configure(text=f"Shown from this session's history in {entry['total_ms']:.0f} ms.")
+            else:
+                self.status_label.configure(text=f"Search completed succesfully in {entry['total_ms'] / 1000:.2f} s.")
+
+        self.sequence_renderer.render(
+            format_fasta(sequence),
+            on_done=rendered,
+            on_slice=lambda lines: self.status_label.configure(text=f"Displaying sequence... {min(99, lines * 100 // expected_lines)}%")
         )
 
-    # Show sequence in the results box
-        self.results_textbox.insert(tk.END, sequence) #this final organism bit uses the python dictionary method.get(key, default_value), in case the organism info is missing from the search results
-        
-
-        #show results in text boxes
-        self.info_textbox.insert("1.0", self.current_info) #start insertion of info at line 1, character 0
-        self.results_textbox.insert("1.0", sequence)
-
-        self.status_label.configure(text="Search completed succesfully.")
-
         #enable buttons
         self.copy_button.configure(state="normal")
         self.save_button.configure(state="normal")
+        self.analysis_button.configure(state="normal" if self.current_analysis else "disabled")
+        self.similar_button.configure(state="normal" if self.current_record else "disabled")
         self.reset_search_button()
 
+    def remember(self, record, sequence, residues):
+        #adds the protein being shown to the session history and refreshes the History menu
+        header = sequence.lstrip().split("\n", 1)[0].lstrip(">").strip()
+        self.session.add(dict(record, Organism=record_organism(record)), header, residues)
+        self.history_labels = {}
+        for entry in self.session.recent(HISTORY_MENU_SIZE):
+            title = entry.title if len(entry.title) <= 40 else entry.title[:39] + "…"
+            self.history_labels[f"{entry.accession}  {title}"] = entry.accession
+        self.history_menu.configure(values=list(self.history_labels), state="normal")
+        self.history_menu.set("History")
+
+    def recall(self, accession):
+        #shows a protein from earlier in the session straight from the session store - no thread and no network request
+        #returns False if it isn't in the session
+        entry = self.session.get(accession) if accession else None
+        self.history_menu.set("History")
+        if entry is None:
+            return False
+        if self.current_token is not None:
+            self.current_token.cancel() #whatever was loading is replaced by this
+        self.hide_suggestions()
+        trace = SearchTrace(accession, "recall")
+        with trace.stage("parse"):
+            sequence = self.session.fasta(entry)
+            analysis = self.analyse_fasta(sequence)
+        self.display_results(entry.summary(), sequence, analysis, trace)
+        return True
+
     def reset_search_button(self): #resets buttons for next user input
         #restore button and hide progress bar
-        self.search_button.configure(state="normal", text="Search Protein") #restores the button - state back to normal so it can be clicked again and changes text back from 'searching' to its original label
+        self.search_button.configure(state="normal", text="Search Protein", command=self.search_protein) #restores the button - state back to normal so it can be clicked again and changes text back from 'cancel search' to its original label
+        self.current_token = None #no search running any more
+        self.current_query = ""
         self.progress_bar.pack_forget() #removes the progress bar from the main window, but is ready to be shown again, thanks to .pack()
 
 
@@ -401,7 +854,7 @@ class ProteinSearchApp: #this wraps all code into a class, keeping code organise
     #5 - COPY + SAVE
     def copy_sequence(self): #finally making the method that copies the sequence that is assigned to the button from above
         #copy to clipboard
-        sequence_text = self.results_textbox.get("1.0", tk.END).strip()#this gets the text from my results text box
+        sequence_text = self.current_sequence.strip() #copies the original FASTA text rather than the textbox, which has the residues split into blocks (and may still be drawing)
         if sequence_text: #another guard clause - this first line is checking if self.current_sequence has a value, ie a sequence that has been stored in it, preventing user copying an empty search result
             self.root.clipboard_clear() #this clears any previous content from the OSs clipboard
             self.root.clipboard_append(sequence_text)
@@ -414,43 +867,238 @@ class ProteinSearchApp: #this wraps all code into a class, keeping code organise
             return
         
         protein_name = self.protein_entry.get().strip() #uses the protein name entered by the user earlier and cleans it
-        default_filename =f"{protein_name.replace(" ", "_")}_sequence.fasta" #creates suggested filename
+        default_filename =f"{protein_name.replace(' ', '_')}_sequence.fasta" #creates suggested filename
 
         file_path = filedialog.asksaveasfilename( #this calles the asksaveasfilename function from the filedialog module to open the OS's save as window
             defaultextension=".fasta",
             initialfile=default_filename, #(the correct parameter name for tkinter's file dialog is initialfile) prefills the filename box with cleaned user version from above
-            filetypes=[("FASTA files", "*.fasta"), ("Text files", "*.txt"), ("All files", "*.*")] #this defines the list of file types seen in the OS's save as window that the user can choose from
+            filetypes=[("FASTA files", "*.fasta"), ("Compressed FASTA files", "*.fasta.gz"), ("Text files", "*.txt"), ("All files", "*.*")] #this defines the list of file types seen in the OS's save as window that the user can choose from
         )
 
         if file_path: #checks user has provided a valid file path
             try: #starts a try block again - involves any code that involves writing to external operations like the disc - put in try block so if it fails it doesnt crash the app
-                with open(file_path, "w") as f: #this opens the file located at file_path. 'w' specifies writing mode, meaning the file will be created/overwritten. 'as f' assigs the file variable to f. the 'with' statement automatically ensures the file is close via f.close()
-                    f.write(f"# Protein Information: \n# {self.current_info.replace(chr(10), chr(10)+'#')}\n\n") #this writes all the protein's info like title, length and organsim to the file as a header. the code replaces every new line in the info string with a newline plus a # symbol to comment out every line of the metadata, out of the FASTA file
-                    f.write(self.current_sequence) #this writes the actual protein sequence(core data) to the file immediatley after the header
+                with open_fasta_output(file_path) as f: #this opens the file located at file_path for writing (gzip compressed if the name ends in .gz), meaning the file will be created/overwritten. 'as f' assigs the file variable to f. the 'with' statement automatically ensures the file is close via f.close()
+                    f.write(f"# Protein Information: \n# {self.current_info.replace(chr(10), chr(10)+'#')}\n\n".encode("utf-8")) #this writes all the protein's info like title, length and organsim to the file as a header. the code replaces every new line in the info string with a newline plus a # symbol to comment out every line of the metadata, out of the FASTA file
+                    for start in range(0, len(self.current_sequence), 1024 * 1024): #this writes the actual protein sequence(core data) to the file immediatley after the header, a megabyte at a time so a huge sequence is never copied in one go
+                        f.write(self.current_sequence[start:start + 1024 * 1024].encode("utf-8"))
                 self.status_label.configure(text=f"Sequence saved to {file_path}") #if the saving is a success, it will update the status_label with success message
             except Exception as e: #if any error from saving process occurs, it's captured in e variable
                 messagebox.showerror("Save Error", f"Could not save file: {str(e)}") #and displays a pop up window with specific error message
         
 
 
-#6- RUN APP
+    def find_similar(self):
+        #ranks every fetched or imported sequence by k-mer similarity to the one being shown and lists the best in the hits list
+        if not self.current_record:
+            return
+        accession, residues = self.current_record
+        token = self.start_task(f"similar:{accession}")
+        if token is None:
+            return
+        self.status_label.configure(text="Searching for similar sequences...")
+        limit = int(self.retmax_menu.get()) #widgets are only read on the main thread
+        threading.Thread(target=self.perform_similar, args=(accession, residues, limit, token), daemon=True).start()
+
+    def perform_similar(self, accession, residues, limit, token):
+        try:
+            similar = self.client.similar_sequences(residues, limit=limit, exclude=accession, token=token)
+            token.check()
+        except SearchCancelled:
+            return
+        except Exception as e:
+            error_msg = f"Could not search for similar sequences: {str(e)}"
+            self.after_search(token, lambda: self.show_error(error_msg))
+            return
+
+        def show():
+            self.show_hits(similar)
+            self.highlight_hit(-1) #the sequence being shown isn't one of these
+            self.status_label.configure(text=f"{len(similar)} similar sequences out of {len(self.client.similarity_index)} indexed")
+            self.reset_search_button()
+        self.after_search(token, show)
+
+    def show_latency(self):
+        #a window with a histogram of how long each stage of the recent searches took
+        window = ctk.CTkToplevel(self.root)
+        window.title("Search latency")
+        window.geometry("640x520")
+        textbox = ctk.CTkTextbox(window, font=ctk.CTkFont(family="Consolas", size=12), wrap="none")
+        textbox.pack(fill="both", expand=True, padx=10, pady=10)
+        textbox.insert("1.0", self.trace_log.histogram_text())
+        textbox.insert(tk.END, f"\nFull trace: {self.trace_log.path}")
+        ui = self.ui.stats()
+        textbox.insert(tk.END, f"\nGUI updates: {ui['posted']} posted, {ui['merged']} merged away, drawn in {ui['frames']} frames")
+        textbox.configure(state="disabled")
+
+    def export_analysis(self):
+        #save the composition, molecular weight, pI, GRAVY and extinction coefficient of the shown sequences as a tab separated table
+        if not self.current_analysis:
+            return
+        protein_name = self.protein_entry.get().strip()
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".tsv",
+            initialfile=f"{protein_name.replace(' ', '_')}_analysis.tsv",
+            filetypes=[("Tab separated tables", "*.tsv"), ("Text files", "*.txt"), ("All files", "*.*")]
+        )
+        if file_path:
+            try:
+                from protein_analytics import write_report
+                names, properties = self.current_analysis
+                write_report(names, properties, file_path)
+                self.status_label.configure(text=f"Analysis saved to {file_path}")
+            except Exception as e:
+                messagebox.showerror("Save Error", f"Could not save file: {str(e)}")
+
+    def export_hits(self):
+        #export every hit of the last search into one multi-FASTA file - the download is streamed straight to disk
+        if not self.current_hits:
+            return
+        protein_name = self.protein_entry.get().strip()
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".fasta",
+            initialfile=f"{protein_name.replace(' ', '_')}_hits.fasta",
+            filetypes=[("FASTA files", "*.fasta"), ("Compressed FASTA files", "*.fasta.gz"), ("All files", "*.*")]
+        )
+        if not file_path:
+            return
+        token = self.start_task(f"export:{file_path}")
+        if token is None:
+            return
+        ids = [str(record.get("Id")) for record in self.current_hits]
+        self.status_label.configure(text=f"Exporting {len(ids)} records...")
+        threading.Thread(target=self.perform_export, args=(ids, file_path, token), daemon=True).start()
+
+    def perform_export(self, ids, file_path, token):
+        #background thread for export_hits - progress is updated as each chunk arrives, using the records parsed so far
+        total = len(ids)
+
+        def progress(bytes_written, records):
+            self.after_search(token, lambda: self.progress_bar.set(records / total), key="progress")
+            self.after_search(token, lambda: self.status_label.configure(text=f"Exporting... {records} of {total} records ({bytes_written // 1024} KB)"), key="status")
+
+        def write(chunk):
+            token.check() #stops the download part way through if the export is cancelled
+            download.write(chunk)
+
+        try:
+            with open_fasta_output(file_path) as f:
+                download = FastaDownload(f, on_progress=progress)
+                self.client.efetch_fasta_stream(write, ids=ids, token=token)
+                download.close()
+            records = download.parser.records
+            self.after_search(token, lambda: self.status_label.configure(text=f"Exported {records} records to {file_path}"), key="status")
+            self.after_search(token, self.reset_search_button)
+        except Exception as e:
+            if os.path.exists(file_path):
+                os.remove(file_path) #don't leave half a file behind
+            if token.cancelled:
+                return
+            error_msg = f"Could not export hits: {str(e)}"
+            self.after_search(token, lambda: self.show_error(error_msg))
+
+
+
+    def import_local_fasta(self):
+        #builds the offset index for a local FASTA file in the background - only needed once per file
+        file_path = filedialog.askopenfilename(
+            filetypes=[("FASTA files", "*.fasta *.fa *.faa *.fas"), ("All files", "*.*")]
+        )
+        if not file_path:
+            return
+        self.import_button.configure(state="disabled", text="Importing...")
+        threading.Thread(target=self.perform_import, args=(file_path,), daemon=True).start()
+
+    def perform_import(self, file_path):
+        def progress(done, total):
+            self.ui.post(lambda: self.status_label.configure(text=f"Indexing {os.path.basename(file_path)}... {done * 100 // max(total, 1)}%"), key="import status")
+
+        try:
+            count = self.client.import_local_fasta(file_path, progress=progress) #also adds the titles to the offline search index
+            self.ui.post(lambda: self.status_label.configure(text=f"Imported {count} sequences from {os.path.basename(file_path)}"), key="import status")
+        except Exception as e:
+            error_msg = f"Could not import {file_path}: {str(e)}"
+            self.ui.post(lambda: messagebox.showerror("Import Error", error_msg))
+        self.ui.post(lambda: self.import_button.configure(state="normal", text="Import Local FASTA"))
+
+
+
+#6- STARTUP
+    def elapsed_ms(self):
+        return round((time.perf_counter() - STARTUP_START) * 1000, 1)
+
+    def startup_ready(self):
+        #the window is up and taking input - show how long that took, then load the rest in the background
+        self.startup_marks["interactive"] = self.elapsed_ms()
+        self.status_label.configure(text=f"Ready in {self.startup_marks['interactive'] / 1000:.2f} s")
+        threading.Thread(target=self.warm_up, daemon=True).start()
+
+    def warm_up(self):
+        #runs on a background thread: imports the slow libraries and opens the connection to NCBI while the user is still
+        #typing, so the first search pays for neither - then writes the startup report
+        timings = {}
+        start = time.perf_counter()
+        from Bio import Entrez
+        import protein_analytics
+        timings["libraries"] = round((time.perf_counter() - start) * 1000, 1)
+        start = time.perf_counter()
+        self.last_warm_up = time.monotonic()
+        try:
+            self.client.session.warm_up()
+            timings["connection"] = round((time.perf_counter() - start) * 1000, 1)
+        except Exception as e: #offline or NCBI unreachable - the first search will report it properly
+            timings["connection_error"] = str(e)
+        self.client.fill_suggestions() #titles seen before type-ahead existed (only does anything the first time)
+        self.cache.purge_expired() #expired responses would only ever be refetched, so they don't need to take up the size cap
+        self.ui.post(lambda: self.report_startup(timings))
+
+    def warm_up_connection(self):
+        #key press in the email or protein entry - re-opens the connection in the background if it may have gone idle
+        if self.last_warm_up is None or time.monotonic() - self.last_warm_up < WARM_UP_INTERVAL:
+            return #startup warm up still running, or the connection is fresh
+        self.last_warm_up = time.monotonic()
+        threading.Thread(target=self.warm_up_quietly, daemon=True).start()
+
+    def warm_up_quietly(self):
+        try:
+            self.client.session.warm_up()
+        except Exception:
+            pass
+
+    def report_startup(self, timings):
+        #the startup timings go into the search trace file (kind "startup", left out of the search histogram) and, with
+        #--startup-report or PROTEIN_APP_STARTUP_REPORT=1, to stdout
+        interactive = self.startup_marks["interactive"]
+        stages = {name: {"ms": ms} for name, ms in self.startup_marks.items()}
+        stages.update({name: {"ms": ms} for name, ms in timings.items() if name != "connection_error"})
+        entry = {
+            "time": round(time.time(), 3), "kind": "startup", "query": "", "total_ms": interactive, "stages": stages,
+            "status": "ok" if interactive <= STARTUP_BUDGET_MS else "over budget", "budget_ms": STARTUP_BUDGET_MS,
+        }
+        if "connection_error" in timings:
+            entry["error"] = timings["connection_error"]
+        self.trace_log.append(entry)
+        if "--startup-report" in sys.argv or os.environ.get("PROTEIN_APP_STARTUP_REPORT"):
+            print(f"Startup: ready for input in {interactive:.0f} ms (budget {STARTUP_BUDGET_MS} ms) - {entry['status']}")
+            for name, ms in self.startup_marks.items():
+                print(f"  {name:<12} {ms:>8.1f} ms since launch")
+            for name, value in timings.items():
+                print(f"  {name:<12} {value:>8.1f} ms in the background" if name != "connection_error" else f"  connection failed: {value}")
+
+
+#7- RUN APP
     def run(self): #this defines the 'run' method for the app
         self.root.mainloop() #this calls the crucial mainloop() method on the main window object(self.root) - puts the window on the screen and starts the event loop
 
 
 
-    #7- MAIN ENTRY POINT
+    #8- MAIN ENTRY POINT
 if __name__ == "__main__": #standard python guard clause - ensures the code block only runs when the script is executed directly
-    try: #starts try block to attempt the necessary imports
-        import tkinter as tk
-        from tkinter import messagebox, filedialog
-        from Bio import Entrez
-        import threading
-
-
-    except ImportError as e: #if either of the imports fail, execution jumps here and the specific missing package is stored in e
-        print(f"Missing required package: {e}")
-        print("Install them with: pip install customtkinter biopython")
+    #Biopython and NumPy are only imported after the window is up, so check they are installed without importing them
+    import importlib.util
+    missing = [name for name in ("Bio", "numpy") if importlib.util.find_spec(name) is None]
+    if missing: #if any is missing the app would only fail on the first search, so stop here instead
+        print(f"Missing required package: {', '.join(missing)}")
+        print("Install them with: pip install customtkinter biopython numpy")
         exit(1) #this causes the app to close due to an error of missing packages#
 
     app = ProteinSearchApp()
@@ -0,0 +1,197 @@
+#headless batch mode - resolves a whole file of protein names/accessions without the GUI
+#names are searched (answered from the cache when possible) several at a time through the shared scheduler, so they go as fast
+#as the rate limit allows rather than one round trip after another - then every UID is posted to NCBI's history server once
+#and summaries + FASTA are pulled back in large chunks, so a 5,000 name panel needs 5,000 esearches plus a few dozen
+#epost/esummary/efetch requests instead of an esummary and an efetch for every name as well
+#the FASTA is streamed straight into the output file as it downloads (gzip compressed if the name ends in .gz or --gzip is given)
+#a chunk whose download breaks off part way is downloaded again from its start, and one that keeps failing (or whose epost,
+#esummary or efetch request still fails once the scheduler has given up retrying) is skipped - its rows are marked
+#download_failed in the TSV instead of the whole batch stopping there
+#
+#usage: python batch_search.py names.txt --email you@example.com --fasta panel.fasta --tsv panel.tsv
+import argparse
+import http.client
+import re
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from fasta_stream import FastaDownload, open_fasta_output
+from ncbi_client import NCBIClient, StreamInterrupted, record_length, record_organism
+
+
+DEFAULT_CHUNK_SIZE = 300 #how many records to ask for per esummary/efetch request
+POST_SIZE = 5000 #epost is a POST request so it can take a lot of ids at once, but very large posts are split up anyway
+CHUNK_ATTEMPTS = 3 #times a chunk's FASTA download is started again after breaking off part way
+SPOOL_SIZE = 16 * 1024 * 1024 #a chunk's FASTA is held in memory up to this size while it downloads, then in a temporary file
+#what a request can still fail with once the scheduler has stopped retrying it - HTTPError/URLError and dropped connections are
+#OSErrors, RemoteDisconnected is also an HTTPException, and Bio.Entrez raises RuntimeError for an <ERROR> reply
+REQUEST_ERRORS = (OSError, http.client.HTTPException, RuntimeError, StreamInterrupted)
+
+#looks like a protein accession (NP_000509.1, P69905, AAA12345.2...) rather than a free text name - these skip esearch
+ACCESSION_PATTERN = re.compile(r"^([A-Z]{2}_\d+|[A-Z]{3}\d{5}|[OPQ]\d[A-Z0-9]{3}\d|[A-NR-Z]\d(?:[A-Z][A-Z0-9]{2}\d){1,2})(\.\d+)?$")
+
+TSV_COLUMNS = ["query", "uid", "accession", "title", "organism", "length", "status"]
+
+
+def read_queries(path):
+    #one protein name or accession per line, blank lines and # comments are ignored
+    with open(path, encoding="utf-8") as f:
+        queries = [line.strip() for line in f]
+    return [q for q in queries if q and not q.startswith("#")]
+
+
+def resolve_queries(client, queries, progress=None):
+    #turns every query into one UID/accession - names go through (cached) esearch, accessions are used as they are
+    #the esearches are waited on from as many threads as the scheduler has workers, so its token bucket (not the round trip
+    #time) is what limits them - the results come back in the order of queries
+    resolved = {query: query if ACCESSION_PATTERN.match(query) else None for query in queries}
+    names = [query for query in resolved if resolved[query] is None]
+    done = len(resolved) - len(names)
+    if progress and done:
+        progress("search", done, len(resolved))
+    with ThreadPoolExecutor(max_workers=client.scheduler.max_workers, thread_name_prefix="resolve") as pool:
+        futures = {pool.submit(client.esearch, name, retmax=1): name for name in names}
+        try:
+            for future in as_completed(futures):
+                ids = future.result()
+                resolved[futures[future]] = ids[0] if ids else None
+                done += 1
+                if progress:
+                    progress("search", done, len(resolved))
+        except BaseException:
+            for future in futures:
+                future.cancel() #don't start the rest once one has failed for good
+            raise
+    return resolved
+
+
+def fetch_chunk(client, fasta_file, downloaded, **params):
+    #downloads one chunk of FASTA (params are efetch_fasta_stream's) into a spool file and only copies it to the output once
+    #the whole reply has arrived, so a download that breaks off can be started again without leaving half a chunk behind (the
+    #output may be gzip compressed, which can't be truncated back) - raises the last StreamInterrupted if every attempt broke off
+    for attempt in range(CHUNK_ATTEMPTS):
+        accessions = set()
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as spool:
+            download = FastaDownload(spool, on_record=lambda header, sequence: accessions.add(header.split(None, 1)[0]))
+            try:
+                client.efetch_fasta_stream(download.write, **params)
+            except StreamInterrupted:
+                if attempt == CHUNK_ATTEMPTS - 1:
+                    raise
+                continue
+            download.close()
+            spool.seek(0)
+            shutil.copyfileobj(spool, fasta_file)
+        downloaded.update(accessions)
+        return
+
+
+def run_batch(queries, fasta_path, tsv_path, email="", client=None, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, compress=None,
+              on_failure=None):
+    #library entry point - returns (found, not_found) counts, not_found includes the rows whose download failed
+    #on_failure(first, last, error) is called for each chunk that could not be downloaded (REQUEST_ERRORS), first and last are
+    #1-based positions in the list of unique ids
+    if client is None:
+        client = NCBIClient(email=email)
+    elif email:
+        client.email = email
+
+    resolved = resolve_queries(client, queries, progress)
+    ids = list(dict.fromkeys(i for i in resolved.values() if i)) #unique, keeping input order
+
+    summaries = {} #uid/accession -> esummary record
+    downloaded = set() #accessions whose FASTA has been written, the sequences themselves go straight to disk
+    failed = set() #ids of the chunks that could not be downloaded
+
+    def fail(first, last, error):
+        failed.update(ids[first:last])
+        if on_failure:
+            on_failure(first + 1, last, error)
+
+    with open_fasta_output(fasta_path, compress) as fasta_file:
+        done = 0
+        for post_start in range(0, len(ids), POST_SIZE):
+            posted = len(ids[post_start:post_start + POST_SIZE])
+            try:
+                webenv, query_key = client.epost(ids[post_start:post_start + POST_SIZE])
+            except REQUEST_ERRORS as e:
+                fail(post_start, post_start + posted, e) #without the post none of its chunks can be fetched
+                done += posted
+                if progress:
+                    progress("fetch", done, len(ids))
+                continue
+            for start in range(0, posted, chunk_size):
+                first, last = post_start + start, post_start + min(start + chunk_size, posted)
+                try:
+                    for record in client.esummary_history(webenv, query_key, start, chunk_size):
+                        for key in (record.get("Id"), record.get("AccessionVersion"), record.get("Caption")):
+                            if key:
+                                summaries[str(key)] = record
+                    fetch_chunk(client, fasta_file, downloaded, webenv=webenv, query_key=query_key, retstart=start,
+                                retmax=chunk_size)
+                except REQUEST_ERRORS as e:
+                    fail(first, last, e)
+                done += last - first
+                if progress:
+                    progress("fetch", done, len(ids))
+
+    found = 0
+    with open(tsv_path, "w", encoding="utf-8") as tsv_file:
+        tsv_file.write("\t".join(TSV_COLUMNS) + "\n")
+        for query in queries:
+            uid = resolved.get(query)
+            record = (summaries.get(uid) or summaries.get(uid.split(".")[0])) if uid else None
+            if record is None:
+                status = "download_failed" if uid in failed else "not_found" #a failed esummary leaves no record either
+                tsv_file.write("\t".join([query, uid or "", "", "", "", "", status]) + "\n")
+                continue
+            accession = str(record.get("AccessionVersion", ""))
+            has_sequence = accession in downloaded
+            status = "found" if has_sequence else "download_failed" if uid in failed else "no_sequence"
+            row = [query, str(record.get("Id", uid)), accession, str(record.get("Title", "")),
+                   record_organism(record), str(record_length(record)), status]
+            tsv_file.write("\t".join(field.replace("\t", " ") for field in row) + "\n")
+            found += has_sequence
+    return found, len(queries) - found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch download protein FASTA + metadata from NCBI")
+    parser.add_argument("input", help="text file with one protein name or accession per line")
+    parser.add_argument("--email", required=True, help="your email address (required by NCBI)")
+    parser.add_argument("--fasta", default="batch_sequences.fasta", help="multi-FASTA output file")
+    parser.add_argument("--tsv", default="batch_metadata.tsv", help="metadata table output file")
+    parser.add_argument("--gzip", action="store_true", default=None, help="gzip compress the FASTA output")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="records per esummary/efetch request")
+    parser.add_argument("--api-key", default=None, help="NCBI API key (raises the rate limit)")
+    parser.add_argument("--report", default=None, help="also write a physicochemical properties table (MW, pI, GRAVY...) of the sequences found")
+    args = parser.parse_args(argv)
+
+    queries = read_queries(args.input)
+    client = NCBIClient(email=args.email, api_key=args.api_key)
+
+    def progress(stage, done, total):
+        print(f"\r{stage}: {done}/{total}", end="", file=sys.stderr, flush=True)
+        if done == total:
+            print(file=sys.stderr)
+
+    def on_failure(first, last, error):
+        print(f"\nrecords {first}-{last} could not be downloaded ({error}), they are marked download_failed in {args.tsv}",
+              file=sys.stderr)
+
+    found, missing = run_batch(queries, args.fasta, args.tsv, client=client, chunk_size=args.chunk_size, progress=progress,
+                               compress=args.gzip, on_failure=on_failure)
+    print(f"{found} sequences written to {args.fasta}, {missing} not found (see {args.tsv})")
+    if args.report:
+        from protein_analytics import report_fasta #needs NumPy, which plain batch downloads don't
+        count = report_fasta(args.fasta, args.report)
+        print(f"Properties of {count} sequences written to {args.report}")
+    net = client.session.stats()
+    print(f"{net['requests']} requests over {net['connections_opened']} connections ({net['reused']} reused), "
+          f"{net['bytes_received']} bytes received", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
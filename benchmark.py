@@ -0,0 +1,234 @@
+#performance benchmarks for the search path, run against the local fake E-utilities server (fake_eutils.py) instead of NCBI
+#reports cold and warm single search latency per stage, batch throughput, memory peak and render time for small, large and
+#huge sequences - save a run with --json and compare a later one against it with --compare to spot regressions
+#everything runs in a temporary directory, so the real cache and indexes in ~/.protein_app are never touched
+#
+#usage: python benchmark.py --latency 0.05 --json before.json
+#       python benchmark.py --latency 0.05 --compare before.json
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from batch_search import run_batch
+from fake_eutils import SIZES, FakeEutils, RecordedPayloads, SyntheticPayloads
+from fasta_stream import parse_fasta_text
+from local_db import LocalDatabases
+from ncbi_cache import EntrezCache
+from ncbi_client import NCBIClient
+from ncbi_scheduler import RequestScheduler
+from ncbi_transport import EutilsSession
+from protein_analytics import analyze_batch
+from search_trace import SearchTrace
+from sequence_view import ChunkedRenderer, format_fasta
+from similarity_search import SimilarityIndex
+from suggestions import SuggestionIndex
+from title_index import TitleIndex
+
+
+def make_client(workdir, server_url, rate):
+    #a client with its own cache, indexes and scheduler in workdir - rate is requests per second (NCBI allows 3, or 10 with a key)
+    os.makedirs(workdir, exist_ok=True)
+    scheduler = RequestScheduler(base_delay=0.05, max_delay=1.0)
+    scheduler.bucket.set_rate(rate)
+    return NCBIClient(
+        email="benchmark@example.com",
+        cache=EntrezCache(os.path.join(workdir, "cache.sqlite3")),
+        scheduler=scheduler,
+        session=EutilsSession(server_url),
+        local_dbs=LocalDatabases(os.path.join(workdir, "local_databases.json")),
+        title_index=TitleIndex(os.path.join(workdir, "title_index.sqlite3")),
+        similarity_index=SimilarityIndex(os.path.join(workdir, "similarity_index.sqlite3")),
+        suggestions=SuggestionIndex(os.path.join(workdir, "suggestions.sqlite3")),
+    )
+
+
+def timed_search(client, term, retmax=5):
+    #the same steps as the app's perform_search (without Tk) - returns (trace dict, FASTA text)
+    trace = SearchTrace(term)
+    with trace.stage("esearch") as stage:
+        ids = client.esearch(term, retmax=retmax, progress=stage.progress)
+    with trace.stage("esummary") as stage:
+        summaries = client.esummary(ids, progress=stage.progress)
+    with trace.stage("efetch") as stage:
+        sequence = client.fetch_fasta(summaries[0], progress=stage.progress)
+    with trace.stage("parse"):
+        records = parse_fasta_text(sequence)
+        analyze_batch([residues for _, residues in records])
+    trace.status = "ok"
+    return trace.to_dict(), sequence
+
+
+def render_times(sequence):
+    #formatting time, plus the time to draw it into a real Tk text widget when there is a display to open one on
+    start = time.perf_counter()
+    lines = sum(1 for _ in format_fasta(sequence))
+    result = {"lines": lines, "format_ms": round((time.perf_counter() - start) * 1000, 2)}
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception as e: #no display (e.g. a CI server)
+        result["tk_ms"] = None
+        result["tk_skipped"] = str(e).splitlines()[0] if str(e) else type(e).__name__
+        return result
+    try:
+        root.withdraw()
+        textbox = tk.Text(root, wrap="none")
+        done = []
+        start = time.perf_counter()
+        ChunkedRenderer(root, textbox).render(format_fasta(sequence), on_done=lambda: done.append(time.perf_counter()))
+        while not done:
+            root.update()
+        result["tk_ms"] = round((done[0] - start) * 1000, 2)
+    finally:
+        root.destroy()
+    return result
+
+
+def memory_peak(function):
+    #peak Python heap (NumPy arrays included) while function runs, in bytes
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(server, workdir, sizes, batch_size, rate, repeats):
+    results = {"single": {}, "render": {}, "memory": {}}
+    for size in sizes:
+        term = f"{size} protein"
+        runs = []
+        for repeat in range(repeats):
+            client = make_client(os.path.join(workdir, f"{size}-{repeat}"), server.url, rate) #new cache = cold search
+            cold, sequence = timed_search(client, term)
+            client.wait_for_indexing() #the similarity sketch of the fetched sequence is made in the background, keep it out of the warm run
+            warm, _ = timed_search(client, term)
+            runs.append((cold, warm))
+        #the middle run by total time, so one slow outlier doesn't decide the result
+        cold = sorted((r[0] for r in runs), key=lambda t: t["total_ms"])[len(runs) // 2]
+        warm = sorted((r[1] for r in runs), key=lambda t: t["total_ms"])[len(runs) // 2]
+        results["single"][size] = {"cold": cold, "warm": warm}
+        results["render"][size] = render_times(sequence)
+        memory_client = make_client(os.path.join(workdir, f"{size}-memory"), server.url, rate)
+        results["memory"][size] = memory_peak(lambda: (timed_search(memory_client, term), memory_client.wait_for_indexing()))
+
+    if batch_size:
+        client = make_client(os.path.join(workdir, "batch"), server.url, rate)
+        queries = [f"benchmark query {i}" for i in range(batch_size)]
+        start = time.perf_counter()
+        found, missing = run_batch(queries, os.path.join(workdir, "batch.fasta"), os.path.join(workdir, "batch.tsv"), client=client)
+        elapsed = time.perf_counter() - start
+        results["batch"] = {
+            "queries": batch_size, "found": found, "missing": missing, "seconds": round(elapsed, 3),
+            "queries_per_second": round(batch_size / elapsed, 1), "scheduler": client.scheduler.stats(),
+        }
+    return results
+
+
+def print_report(results):
+    print(f"\nSingle search latency (ms) - {results['meta']['latency'] * 1000:.0f} ms simulated latency, "
+          f"failure rate {results['meta']['failure_rate']}")
+    stages = ["esearch", "esummary", "efetch", "parse"]
+    print(f"  {'size':<6} {'run':<5} " + " ".join(f"{s:>9}" for s in stages) + f" {'total':>9}")
+    for size, runs in results["single"].items():
+        for kind in ("cold", "warm"):
+            trace = runs[kind]
+            cells = " ".join(f"{trace['stages'].get(s, {}).get('ms', 0):>9.1f}" for s in stages)
+            print(f"  {size:<6} {kind:<5} {cells} {trace['total_ms']:>9.1f}")
+
+    print("\nRender time")
+    for size, render in results["render"].items():
+        tk_text = f"{render['tk_ms']:.1f} ms in Tk" if render.get("tk_ms") is not None else f"Tk skipped ({render.get('tk_skipped')})"
+        print(f"  {size:<6} {render['lines']:>8} lines  format {render['format_ms']:.1f} ms  {tk_text}")
+
+    print("\nMemory peak (one cold search)")
+    for size, peak in results["memory"].items():
+        print(f"  {size:<6} {peak / 1024 / 1024:8.1f} MB")
+
+    if "batch" in results:
+        batch = results["batch"]
+        print(f"\nBatch: {batch['queries']} queries in {batch['seconds']:.2f} s ({batch['queries_per_second']} queries/s), "
+              f"{batch['found']} found, {batch['scheduler']['retries']} retries")
+    print(f"\nPeak RSS {results['meta']['max_rss_mb']} MB")
+
+
+def key_metrics(results):
+    #flat name -> number view of the numbers worth comparing between runs (lower is better for all of them)
+    metrics = {}
+    for size, runs in results.get("single", {}).items():
+        for kind, trace in runs.items():
+            metrics[f"{size} {kind} total ms"] = trace["total_ms"]
+    for size, render in results.get("render", {}).items():
+        metrics[f"{size} format ms"] = render["format_ms"]
+        if render.get("tk_ms") is not None:
+            metrics[f"{size} tk render ms"] = render["tk_ms"]
+    for size, peak in results.get("memory", {}).items():
+        metrics[f"{size} memory MB"] = round(peak / 1024 / 1024, 2)
+    if "batch" in results:
+        metrics["batch seconds"] = results["batch"]["seconds"]
+    return metrics
+
+
+def print_comparison(results, baseline):
+    print("\nCompared with baseline")
+    before = key_metrics(baseline)
+    for name, value in key_metrics(results).items():
+        if name in before and before[name]:
+            change = (value - before[name]) * 100 / before[name]
+            print(f"  {name:<24} {before[name]:>10.1f} -> {value:>10.1f}  ({change:+.0f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the search path against a local fake E-utilities server")
+    parser.add_argument("--sizes", nargs="+", default=list(SIZES), choices=list(SIZES), help="sequence size classes to search")
+    parser.add_argument("--batch", type=int, default=500, help="queries in the batch throughput run (0 to skip)")
+    parser.add_argument("--repeats", type=int, default=3, help="cold/warm searches per size, the median is reported")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the fake server waits before every reply")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--bandwidth", type=float, default=None, help="bytes per second for reply bodies")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of requests that fail with a 503 (0-1)")
+    parser.add_argument("--rate", type=float, default=1000, help="client requests per second (3 = NCBI's limit without a key)")
+    parser.add_argument("--payloads", default=None, help="directory of recorded payloads (see fake_eutils.py --record)")
+    parser.add_argument("--json", default=None, help="write the results to this file")
+    parser.add_argument("--compare", default=None, help="results file from an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    payloads = RecordedPayloads(args.payloads) if args.payloads else SyntheticPayloads()
+    if isinstance(payloads, SyntheticPayloads):
+        for size in args.sizes:
+            payloads.sequence(payloads.search(f"{size} protein", 1)[0]) #generate the records up front, not inside the timings
+
+    with tempfile.TemporaryDirectory(prefix="protein_benchmark_") as workdir, \
+            FakeEutils(payloads, latency=args.latency, jitter=args.jitter, bandwidth=args.bandwidth,
+                       failure_rate=args.failure_rate) as server:
+        results = run(server, workdir, args.sizes, args.batch, args.rate, max(1, args.repeats))
+        results["server"] = server.stats()
+
+    try:
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    except ImportError: #Windows
+        max_rss = None
+    results["meta"] = {
+        "time": time.time(), "python": platform.python_version(), "platform": platform.platform(),
+        "latency": args.latency, "failure_rate": args.failure_rate, "rate": args.rate,
+        "max_rss_mb": round(max_rss, 1) if max_rss else None,
+    }
+    print_report(results)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(results, json.load(f))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
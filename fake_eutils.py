@@ -0,0 +1,324 @@
+#local stand-in for the NCBI E-utilities (esearch / esummary / efetch / epost) for benchmarks and offline testing
+#it answers with synthetic records of known sizes, or replays payloads recorded from the real service (record_payloads), and can
+#add latency, limit bandwidth and fail a share of requests so the retry, streaming and progress code paths can all be exercised
+#point the app at it with the NCBI_EUTILS_URL environment variable, or pass EutilsSession(base_url=server.url)
+#
+#usage: python fake_eutils.py --port 8765 --latency 0.2 --failure-rate 0.05
+import argparse
+import gzip
+import os
+import random
+import re
+import socket
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit
+from xml.sax.saxutils import escape
+
+
+#sequence length of each synthetic size class - a search term containing the class name returns records of that length
+SIZES = {"small": 150, "large": 35_000, "huge": 2_000_000}
+UID_BASE = {"small": 1_000_000, "large": 2_000_000, "huge": 3_000_000}
+RESIDUES = "ACDEFGHIKLMNPQRSTVWY"
+
+ESEARCH_HEAD = ('<?xml version="1.0" encoding="UTF-8" ?>\n<!DOCTYPE eSearchResult PUBLIC "-//NLM//DTD esearch 20060628//EN" '
+                '"https://eutils.ncbi.nlm.nih.gov/eutils/dtd/20060628/esearch.dtd">\n')
+ESUMMARY_HEAD = ('<?xml version="1.0" encoding="UTF-8" ?>\n<!DOCTYPE eSummaryResult PUBLIC "-//NLM//DTD esummary v1 20041029//EN" '
+                 '"https://eutils.ncbi.nlm.nih.gov/eutils/dtd/20041029/esummary-v1.dtd">\n')
+EPOST_HEAD = ('<?xml version="1.0" encoding="UTF-8" ?>\n<!DOCTYPE ePostResult PUBLIC "-//NLM//DTD epost 20090526//EN" '
+              '"https://eutils.ncbi.nlm.nih.gov/eutils/dtd/20090526/epost.dtd">\n')
+DOCSUM_PATTERN = re.compile(r"<DocSum>.*?</DocSum>", re.S)
+
+
+def esearch_xml(ids, term=""):
+    id_list = "".join(f"<Id>{escape(str(uid))}</Id>" for uid in ids)
+    return (f"{ESEARCH_HEAD}<eSearchResult><Count>{len(ids)}</Count><RetMax>{len(ids)}</RetMax><RetStart>0</RetStart>"
+            f"<IdList>{id_list}</IdList><TranslationSet/><QueryTranslation>{escape(term)}</QueryTranslation></eSearchResult>\n")
+
+
+def count_xml(count):
+    return f"{ESEARCH_HEAD}<eSearchResult><Count>{count}</Count></eSearchResult>\n"
+
+
+def espell_xml(term, corrected=""):
+    return (f'<?xml version="1.0" encoding="UTF-8" ?>\n<eSpellResult><Database>protein</Database><Query>{escape(term)}</Query>'
+            f"<CorrectedQuery>{escape(corrected)}</CorrectedQuery><SpelledQuery/><ERROR/></eSpellResult>\n")
+
+
+def docsum_xml(uid, accession, title, length, taxid=9606):
+    return (f'<DocSum><Id>{uid}</Id><Item Name="Caption" Type="String">{escape(accession.split(".")[0])}</Item>'
+            f'<Item Name="Title" Type="String">{escape(title)}</Item><Item Name="Gi" Type="Integer">{uid}</Item>'
+            f'<Item Name="TaxId" Type="Integer">{taxid}</Item><Item Name="Length" Type="Integer">{length}</Item>'
+            f'<Item Name="AccessionVersion" Type="String">{escape(accession)}</Item></DocSum>')
+
+
+def esummary_xml(docsums):
+    return f"{ESUMMARY_HEAD}<eSummaryResult>{''.join(docsums)}</eSummaryResult>\n"
+
+
+class SyntheticPayloads:
+    #made up but deterministic records - the same uid always gets the same sequence, so runs can be compared
+    def __init__(self, hits_per_term=20):
+        self.hits_per_term = hits_per_term
+        self._sequences = {}
+        self._lock = threading.Lock()
+
+    def size_class(self, uid):
+        uid = int(uid)
+        for name, base in sorted(UID_BASE.items(), key=lambda item: -item[1]):
+            if uid > base:
+                return name
+        return "small"
+
+    def search(self, term, retmax):
+        #"huge protein" -> huge records, anything else without a size class name (e.g. batch names) -> one small record per term
+        term_lower = term.lower()
+        for name in SIZES:
+            if name in term_lower:
+                return [str(UID_BASE[name] + i + 1) for i in range(min(retmax, self.hits_per_term))]
+        return [str(UID_BASE["small"] + zlib.crc32(term_lower.encode("utf-8")) % 900_000 + 1)][:retmax]
+
+    def accession(self, uid):
+        return f"BM_{uid}.1"
+
+    def docsum(self, uid):
+        size = self.size_class(uid)
+        return docsum_xml(uid, self.accession(uid), f"benchmark {size} protein {uid} [Homo sapiens]", SIZES[size])
+
+    def sequence(self, uid):
+        with self._lock:
+            sequence = self._sequences.get(uid)
+        if sequence is None:
+            sequence = "".join(random.Random(int(uid)).choices(RESIDUES, k=SIZES[self.size_class(uid)]))
+            with self._lock:
+                self._sequences[uid] = sequence
+        return sequence
+
+    def fasta(self, uid):
+        sequence = self.sequence(uid)
+        lines = [sequence[i:i + 70] for i in range(0, len(sequence), 70)] #NCBI wraps FASTA at 70 residues
+        title = f"benchmark {self.size_class(uid)} protein {uid} [Homo sapiens]"
+        return f">{self.accession(uid)} {title}\n" + "\n".join(lines) + "\n"
+
+
+class RecordedPayloads:
+    #replays responses saved by record_payloads - esearch/<term>.xml, esummary/<uid>.xml and efetch/<uid>.fasta
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _read(self, endpoint, key, suffix):
+        path = os.path.join(self.directory, endpoint, quote(key, safe="") + suffix)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+
+    def search(self, term, retmax):
+        xml = self._read("esearch", " ".join(term.lower().split()), ".xml")
+        return re.findall(r"<Id>(\d+)</Id>", xml)[:retmax] if xml else []
+
+    def docsum(self, uid):
+        xml = self._read("esummary", uid, ".xml")
+        match = DOCSUM_PATTERN.search(xml) if xml else None
+        return match.group(0) if match else None
+
+    def fasta(self, uid):
+        return self._read("efetch", uid, ".fasta") or ""
+
+
+def record_payloads(directory, terms, email, retmax=5, session=None):
+    #saves real NCBI responses for a list of search terms (and their hits) so benchmarks can replay them later
+    from ncbi_transport import TOOL_NAME, EutilsSession
+    session = session or EutilsSession()
+    for endpoint in ("esearch", "esummary", "efetch"):
+        os.makedirs(os.path.join(directory, endpoint), exist_ok=True)
+
+    def save(endpoint, key, suffix, data):
+        with open(os.path.join(directory, endpoint, quote(key, safe="") + suffix), "wb") as f:
+            f.write(data)
+
+    common = {"db": "protein", "tool": TOOL_NAME, "email": email}
+    for term in terms:
+        xml = session.request("esearch.fcgi", dict(common, term=term, retmax=retmax))
+        save("esearch", " ".join(term.lower().split()), ".xml", xml)
+        for uid in re.findall(rb"<Id>(\d+)</Id>", xml):
+            uid = uid.decode()
+            save("esummary", uid, ".xml", session.request("esummary.fcgi", dict(common, id=uid)))
+            save("efetch", uid, ".fasta", session.request("efetch.fcgi", dict(common, id=uid, rettype="fasta", retmode="text")))
+            time.sleep(0.4) #stay under NCBI's 3 requests per second
+
+
+class FakeEutils:
+    #threaded HTTP/1.1 server with keep-alive and gzip, like the real one - use as a context manager or call start()/stop()
+    #latency (+ random jitter) is slept before every reply, bandwidth (bytes per second) paces the body, and failure_rate
+    #is the share of requests answered with failure_status instead
+    def __init__(self, payloads=None, port=0, latency=0.0, jitter=0.0, bandwidth=None, failure_rate=0.0, failure_status=503, seed=0):
+        self.payloads = payloads or SyntheticPayloads()
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._histories = {} #WebEnv -> posted ids
+        self.requests = 0
+        self.failures = 0
+        self.bytes_sent = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}/entrez/eutils/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "failures": self.failures, "bytes_sent": self.bytes_sent}
+
+    def _delay_and_fail(self):
+        #returns True if this request should fail
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+            fail = self._random.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        if delay:
+            time.sleep(delay)
+        return fail
+
+    def respond(self, endpoint, params):
+        #(content type, body) for one request
+        def param(name, default=""):
+            return params.get(name, [default])[0]
+
+        ids = [i for i in param("id").split(",") if i]
+        if param("WebEnv") or param("webenv"):
+            with self._lock:
+                posted = self._histories.get(param("WebEnv") or param("webenv"), [])
+            start = int(param("retstart", "0") or 0)
+            ids = posted[start:start + int(param("retmax", str(len(posted))) or len(posted))]
+        if endpoint == "esearch.fcgi" and param("rettype") == "count":
+            return "text/xml", count_xml(len(self.payloads.search(param("term"), 100000)))
+        if endpoint == "espell.fcgi":
+            return "text/xml", espell_xml(param("term")) #nothing to correct
+        if endpoint == "esearch.fcgi":
+            return "text/xml", esearch_xml(self.payloads.search(param("term"), int(param("retmax", "20") or 20)), param("term"))
+        if endpoint == "esummary.fcgi":
+            return "text/xml", esummary_xml([d for d in (self.payloads.docsum(uid) for uid in ids) if d])
+        if endpoint == "efetch.fcgi":
+            return "text/plain", "".join(self.payloads.fasta(uid) for uid in ids)
+        if endpoint == "epost.fcgi":
+            with self._lock:
+                webenv = f"MCID_fake_{len(self._histories) + 1}"
+                self._histories[webenv] = ids
+            return "text/xml", f"{EPOST_HEAD}<ePostResult><QueryKey>1</QueryKey><WebEnv>{webenv}</WebEnv></ePostResult>\n"
+        return None, None
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" #keep-alive, so connection reuse behaves like it does against NCBI
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                #headers and body go out as separate writes - without this, Nagle's algorithm holds the body back until the
+                #client's delayed ACK (~40 ms) and every reply looks slower than the latency being simulated
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                self._reply(parts.path.rsplit("/", 1)[-1], parse_qs(parts.query))
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0) or 0)).decode("utf-8")
+                self._reply(urlsplit(self.path).path.rsplit("/", 1)[-1], parse_qs(body))
+
+            def _reply(self, endpoint, params):
+                if server._delay_and_fail():
+                    self._send(server.failure_status, "text/plain", b"Simulated failure")
+                    return
+                content_type, body = server.respond(endpoint, params)
+                if body is None:
+                    self._send(404, "text/plain", b"Unknown endpoint")
+                    return
+                self._send(200, content_type, body.encode("utf-8"))
+
+            def _send(self, status, content_type, body):
+                gzipped = "gzip" in self.headers.get("Accept-Encoding", "")
+                if gzipped:
+                    body = gzip.compress(body, compresslevel=6)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                if gzipped:
+                    self.send_header("Content-Encoding", "gzip")
+                self.end_headers()
+                step = 64 * 1024
+                for start in range(0, len(body), step):
+                    self.wfile.write(body[start:start + step])
+                    if server.bandwidth:
+                        time.sleep(min(step, len(body) - start) / server.bandwidth)
+                with server._lock:
+                    server.bytes_sent += len(body)
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake NCBI E-utilities server for benchmarks and offline testing")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--payloads", default=None, help="directory of recorded payloads (default: synthetic records)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added before every reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra random seconds per reply")
+    parser.add_argument("--bandwidth", type=float, default=None, help="bytes per second for reply bodies")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of requests answered with an error (0-1)")
+    parser.add_argument("--failure-status", type=int, default=503)
+    parser.add_argument("--record", nargs="+", metavar="TERM", help="record real NCBI payloads for these terms into --payloads and exit")
+    parser.add_argument("--email", default="", help="your email address (for --record)")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        if not args.payloads:
+            parser.error("--record needs --payloads DIR")
+        record_payloads(args.payloads, args.record, args.email)
+        print(f"Recorded {len(args.record)} searches into {args.payloads}")
+        return
+    payloads = RecordedPayloads(args.payloads) if args.payloads else SyntheticPayloads()
+    server = FakeEutils(payloads, port=args.port, latency=args.latency, jitter=args.jitter, bandwidth=args.bandwidth,
+                        failure_rate=args.failure_rate, failure_status=args.failure_status)
+    print(f"Serving fake E-utilities on {server.url} - set NCBI_EUTILS_URL={server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
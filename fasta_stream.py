@@ -0,0 +1,105 @@
+#streaming FASTA downloads and exports
+#efetch replies are copied to disk chunk by chunk as they arrive (optionally gzip compressed) instead of being read into memory
+#with handle.read(), and records are parsed incrementally on the way through so progress and partial results can be shown
+#before the download has finished
+import codecs
+import gzip
+
+
+def open_fasta_output(path, compress=None):
+    #opens a FASTA file for writing in binary mode - gzip compressed if asked for, or if the file name ends in .gz
+    if compress is None:
+        compress = path.endswith(".gz")
+    if compress:
+        return gzip.open(path, "wb", compresslevel=6)
+    return open(path, "wb")
+
+
+class FastaStreamParser:
+    #feed it FASTA text in arbitrary pieces (a record can be split anywhere, even mid line) and it returns the records completed so far
+    def __init__(self):
+        self._partial = "" #text after the last newline seen, not a complete line yet
+        self._header = None
+        self._residues = []
+        self.records = 0
+
+    def feed(self, text):
+        #returns a list of (header, sequence) tuples for every record that finished inside this piece of text
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        finished = []
+        for line in lines:
+            self._add_line(line.rstrip("\r"), finished)
+        return finished
+
+    def close(self):
+        #call once the stream has ended - returns the last record (if any)
+        finished = []
+        if self._partial:
+            self._add_line(self._partial.rstrip("\r"), finished)
+            self._partial = ""
+        if self._header is not None:
+            finished.append(self._finish())
+        return finished
+
+    def _add_line(self, line, finished):
+        if line.startswith(">"):
+            if self._header is not None:
+                finished.append(self._finish())
+            self._header = line[1:]
+        elif line and self._header is not None:
+            self._residues.append(line.strip())
+
+    def _finish(self):
+        record = (self._header, "".join(self._residues))
+        self._header = None
+        self._residues = []
+        self.records += 1
+        return record
+
+
+class FastaDownload:
+    #sink for a streamed efetch reply - writes every chunk straight to the output file and parses records as they complete
+    #on_record(header, sequence) is called for each finished record, on_progress(bytes_written, records) after each chunk
+    def __init__(self, output, on_record=None, on_progress=None):
+        self.output = output
+        self.on_record = on_record
+        self.on_progress = on_progress
+        self.parser = FastaStreamParser()
+        self._decoder = codecs.getincrementaldecoder("utf-8")() #a chunk can end in the middle of a multi-byte character
+        self.bytes_written = 0
+
+    def write(self, chunk):
+        self.output.write(chunk)
+        self.bytes_written += len(chunk)
+        self._handle(self.parser.feed(self._decoder.decode(chunk)))
+        if self.on_progress:
+            self.on_progress(self.bytes_written, self.parser.records)
+
+    def close(self):
+        #flushes the parser at the end of the download, the output file itself is closed by whoever opened it
+        self._handle(self.parser.feed(self._decoder.decode(b"", final=True)) + self.parser.close())
+
+    def _handle(self, records):
+        if self.on_record:
+            for header, sequence in records:
+                self.on_record(header, sequence)
+
+
+def iter_fasta_file(path, chunk_size=1024 * 1024):
+    #yields (header, sequence) for every record of a FASTA file (.gz too), reading it a chunk at a time
+    opener = gzip.open if path.endswith(".gz") else open
+    parser = FastaStreamParser()
+    with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+        while True:
+            text = f.read(chunk_size)
+            if not text:
+                break
+            yield from parser.feed(text)
+    yield from parser.close()
+
+
+def parse_fasta_text(text):
+    #all (header, sequence) records in a FASTA string
+    parser = FastaStreamParser()
+    return parser.feed(text) + parser.close()
@@ -0,0 +1,238 @@
+#local FASTA databases (Swiss-Prot, RefSeq protein dumps...) for offline lookups
+#importing a file builds a compact faidx style offset index once (accession -> byte offsets + line layout), stored in a small
+#SQLite file next to it - after that the FASTA itself is only ever opened with mmap, so startup never reads it into RAM and a
+#lookup is one index query plus a slice of the mapped file
+import json
+import mmap
+import os
+import sqlite3
+import threading
+
+
+DEFAULT_REGISTRY_PATH = os.path.join(os.path.expanduser("~"), ".protein_app", "local_databases.json")
+INDEX_SUFFIX = ".pidx.sqlite3"
+DB_TAGS = {"sp", "tr", "ref", "gi", "gb", "emb", "dbj", "pdb", "pir", "prf", "lcl", "gnl"} #database tags in "sp|P69905|HBA_HUMAN" style ids, not accessions
+
+
+def header_keys(header):
+    #all the names a record can be looked up by - the first word of the header, each part of a pipe separated id,
+    #and accessions without their version number (NP_000509.1 -> NP_000509)
+    first = header.split(None, 1)[0] if header.strip() else ""
+    keys = [first]
+    for part in first.split("|"):
+        if part and part not in DB_TAGS and not part.isdigit():
+            keys.append(part)
+    for key in list(keys):
+        base, dot, version = key.rpartition(".")
+        if dot and base and version.isdigit():
+            keys.append(base)
+    return list(dict.fromkeys(k for k in keys if k))
+
+
+def index_path_for(fasta_path):
+    return fasta_path + INDEX_SUFFIX
+
+
+def build_index(fasta_path, index_path=None, progress=None, batch_size=10000, on_headers=None):
+    #scans the FASTA once (streaming, line by line) and writes the offset index - returns the number of records indexed
+    #progress(bytes_done, total_bytes) is called every batch_size records, on_headers(list_of_headers) with each batch's headers
+    if fasta_path.endswith(".gz"):
+        raise ValueError("Compressed FASTA files can't be memory mapped - please decompress it first")
+    index_path = index_path or index_path_for(fasta_path)
+    total = os.path.getsize(fasta_path)
+    tmp_path = index_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    conn.execute(
+        "CREATE TABLE records (id INTEGER PRIMARY KEY, header_offset INTEGER, seq_offset INTEGER, seq_end INTEGER,"
+        " length INTEGER, line_bases INTEGER, line_bytes INTEGER)"
+    )
+    conn.execute("CREATE TABLE keys (key TEXT PRIMARY KEY, record INTEGER) WITHOUT ROWID")
+    conn.execute("CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)")
+
+    records = []
+    keys = []
+    headers = []
+    count = 0
+
+    def flush():
+        conn.executemany("INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?)", records)
+        conn.executemany("INSERT OR IGNORE INTO keys VALUES (?, ?)", keys) #first record wins if an accession appears twice
+        if on_headers and headers:
+            on_headers(list(headers))
+        records.clear()
+        keys.clear()
+        headers.clear()
+
+    def finish(current, end):
+        header_offset, seq_offset, length, line_bases, line_bytes, short_seen, regular = current
+        if not regular:
+            line_bases = line_bytes = 0 #uneven line lengths, so no fixed layout to record
+        records.append((count, header_offset, seq_offset, end, length, line_bases, line_bytes))
+
+    offset = 0
+    current = None #[header_offset, seq_offset, length, line_bases, line_bytes, short line seen, regular layout]
+    with open(fasta_path, "rb") as f:
+        for line in f:
+            if line.startswith(b">"):
+                if current is not None:
+                    finish(current, offset)
+                    count += 1
+                    if len(records) >= batch_size:
+                        flush()
+                        if progress:
+                            progress(offset, total)
+                header = line[1:].decode("utf-8", "replace").strip()
+                keys.extend((key, count) for key in header_keys(header))
+                headers.append(header)
+                current = [offset, offset + len(line), 0, 0, 0, False, True]
+            elif current is not None:
+                bases = len(line.rstrip(b"\r\n"))
+                if bases:
+                    if current[3] == 0:
+                        current[3], current[4] = bases, len(line)
+                    elif current[5] or bases > current[3] or len(line) != current[4] and bases == current[3]:
+                        current[6] = False
+                    if bases < current[3]:
+                        current[5] = True #only the last line of a record may be shorter
+                    current[2] += bases
+            offset += len(line)
+    if current is not None:
+        finish(current, offset)
+        count += 1
+    flush()
+    conn.execute("INSERT INTO meta VALUES ('fasta_size', ?), ('fasta_mtime', ?)", (str(total), str(os.path.getmtime(fasta_path))))
+    conn.commit()
+    conn.close()
+    os.replace(tmp_path, index_path)
+    if progress:
+        progress(total, total)
+    return count
+
+
+class LocalFastaDB:
+    #one indexed FASTA file, opened with mmap
+    def __init__(self, fasta_path, index_path=None):
+        self.fasta_path = fasta_path
+        self.index_path = index_path or index_path_for(fasta_path)
+        if not os.path.exists(self.index_path):
+            raise FileNotFoundError(f"No index for {fasta_path} - import it first")
+        self._conn = sqlite3.connect(self.index_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        meta = dict(self._conn.execute("SELECT name, value FROM meta"))
+        size = int(meta["fasta_size"])
+        #an edit that keeps the file's size (one residue changed) only shows in its modification time
+        if size != os.path.getsize(fasta_path) or float(meta["fasta_mtime"]) != os.path.getmtime(fasta_path):
+            raise ValueError(f"{fasta_path} has changed since it was indexed - import it again")
+        self._file = open(fasta_path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.name = os.path.basename(fasta_path)
+
+    def _locate(self, key):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT r.header_offset, r.seq_offset, r.seq_end, r.length, r.line_bases, r.line_bytes"
+                " FROM keys k JOIN records r ON r.id = k.record WHERE k.key = ?", (key,)
+            ).fetchone()
+
+    def __contains__(self, key):
+        return self._locate(key) is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def raw(self, key):
+        #the whole record (header + sequence lines) as a memoryview straight onto the mapped file - no copy, or None if unknown
+        location = self._locate(key)
+        if location is None:
+            return None
+        return memoryview(self._map)[location[0]:location[2]]
+
+    def fasta(self, key):
+        #the record as FASTA text, the same as efetch would return it
+        view = self.raw(key)
+        return None if view is None else str(view, "utf-8", "replace")
+
+    def sequence(self, key):
+        #just the residues, with the line breaks taken out
+        location = self._locate(key)
+        if location is None:
+            return None
+        return bytes(self._map[location[1]:location[2]]).replace(b"\n", b"").replace(b"\r", b"").decode("ascii", "replace")
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+        self._conn.close()
+
+
+class LocalDatabases:
+    #every FASTA file the user has imported - the list of paths is remembered between runs, the files are only opened when first used
+    def __init__(self, registry_path=DEFAULT_REGISTRY_PATH):
+        self.registry_path = registry_path
+        self._lock = threading.Lock()
+        self._open = {} #path -> LocalFastaDB
+        self.paths = []
+        if os.path.exists(registry_path):
+            with open(registry_path, encoding="utf-8") as f:
+                self.paths = [p for p in json.load(f) if os.path.exists(p)]
+        self.hits = 0
+        self.misses = 0
+
+    def _save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.registry_path)), exist_ok=True)
+        with open(self.registry_path, "w", encoding="utf-8") as f:
+            json.dump(self.paths, f, indent=2)
+
+    def import_fasta(self, fasta_path, progress=None, on_headers=None):
+        #indexes a FASTA file and adds it to the list - returns the number of records
+        fasta_path = os.path.abspath(fasta_path)
+        count = build_index(fasta_path, progress=progress, on_headers=on_headers)
+        with self._lock:
+            old = self._open.pop(fasta_path, None)
+            if old is not None:
+                old.close()
+            if fasta_path not in self.paths:
+                self.paths.append(fasta_path)
+            self._save()
+        return count
+
+    def databases(self):
+        with self._lock:
+            for path in self.paths:
+                if path not in self._open:
+                    try:
+                        self._open[path] = LocalFastaDB(path)
+                    except (OSError, ValueError):
+                        continue #missing or changed since import, skipped until it is imported again
+            return [self._open[path] for path in self.paths if path in self._open]
+
+    def lookup_fasta(self, accession, *fallbacks):
+        #FASTA text for accession, or failing that the first of fallbacks (e.g. the unversioned Caption) found in any local
+        #database, or None - a fallback only counts if the record it finds is the same version as accession, so NP_000509.1
+        #is never answered with a file's NP_000509.2
+        for db in self.databases():
+            for key in (accession,) + fallbacks:
+                if key:
+                    text = db.fasta(key)
+                    if text is not None and (key == accession or same_version(text, accession)):
+                        self.hits += 1
+                        return text
+        self.misses += 1
+        return None
+
+
+def same_version(fasta, accession):
+    #False if the record's header carries a different version of accession - records without a version (UniProt's P69905)
+    #and accessions without one can't disagree
+    base, dot, version = accession.rpartition(".")
+    if not (dot and base and version.isdigit()):
+        return True
+    for key in header_keys(fasta[1:fasta.find("\n")] if "\n" in fasta else fasta[1:]):
+        key_base, key_dot, key_version = key.rpartition(".")
+        if key_dot and key_base == base and key_version.isdigit():
+            return key_version == version
+    return True
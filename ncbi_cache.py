@@ -0,0 +1,150 @@
+#persistent on-disk cache for NCBI Entrez responses (esearch / esummary / efetch)
+#the raw response bytes are stored in a small SQLite file, keyed by endpoint + normalized term or UID,
+#so repeat searches for the same protein are answered locally instead of going back to NCBI
+import os
+import sqlite3
+import threading
+import time
+
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".protein_app", "entrez_cache.sqlite3")
+
+#how long (in seconds) a cached response stays fresh for each endpoint - search hits change more often than sequences do
+DEFAULT_TTLS = {
+    "esearch": 24 * 60 * 60, #1 day
+    "esummary": 7 * 24 * 60 * 60, #1 week
+    "efetch": 30 * 24 * 60 * 60, #30 days
+    "espell": 30 * 24 * 60 * 60, #spelling corrections hardly change
+}
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024 #size cap for the whole cache, least recently used entries are dropped past this
+
+#cache modes - "normal" uses the cache and falls back to NCBI, "cache_only" never touches the network,
+#"refresh" always goes to NCBI but still stores the new response
+MODE_NORMAL = "normal"
+MODE_CACHE_ONLY = "cache_only"
+MODE_REFRESH = "refresh"
+CACHE_MODES = (MODE_NORMAL, MODE_CACHE_ONLY, MODE_REFRESH)
+
+
+class CacheMiss(LookupError):
+    #raised in cache only mode when the requested response has never been stored (or has expired)
+    pass
+
+
+def normalize_term(term):
+    #"  Human   Insulin " and "human insulin" should share one cache entry
+    return " ".join(term.lower().split())
+
+
+class EntrezCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttls=None, max_bytes=DEFAULT_MAX_BYTES, mode=MODE_NORMAL):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.max_bytes = max_bytes
+        self.set_mode(mode)
+        self.hits = 0
+        self.misses = 0
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        #one connection shared by every search thread, the lock makes sure only one thread uses it at a time
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " endpoint TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " data BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " stored_at REAL NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (endpoint, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._conn.commit()
+
+    def set_mode(self, mode):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode: {mode}")
+        self.mode = mode
+
+    def get(self, endpoint, key):
+        #returns the stored bytes, or None if there is nothing fresh for this key
+        now = time.time()
+        ttl = self.ttls.get(endpoint, 0)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, stored_at FROM responses WHERE endpoint = ? AND key = ?", (endpoint, key)
+            ).fetchone()
+            if row is None or now - row[1] > ttl:
+                self.misses += 1
+                return None
+            #touching last_used is what makes eviction least-recently-used rather than oldest-first
+            self._conn.execute(
+                "UPDATE responses SET last_used = ? WHERE endpoint = ? AND key = ?", (now, endpoint, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return bytes(row[0])
+
+    def put(self, endpoint, key, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (endpoint, key, data, size, stored_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (endpoint, key, sqlite3.Binary(data), len(data), now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def fetch(self, endpoint, key, loader, label=None):
+        #main entry point - answer from the cache if possible, otherwise call loader() (the real NCBI request) and store what it returns
+        #label says what was asked for in the user's terms (e.g. "The search 'human insulin'"), for the CacheMiss message
+        if self.mode != MODE_REFRESH:
+            data = self.get(endpoint, key)
+            if data is not None:
+                return data
+        if self.mode == MODE_CACHE_ONLY:
+            raise CacheMiss(f"{label or 'This request'} is not in the local cache")
+        data = loader()
+        self.put(endpoint, key, data)
+        return data if isinstance(data, bytes) else data.encode("utf-8")
+
+    def _evict(self):
+        #drop least recently used entries until the cache fits under max_bytes - caller must hold the lock
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT endpoint, key, size FROM responses ORDER BY last_used ASC").fetchall()
+        for endpoint, key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE endpoint = ? AND key = ?", (endpoint, key))
+            total -= size
+
+    def purge_expired(self):
+        #drops every entry past its TTL - they are never served again, only refetched - called once per startup
+        now = time.time()
+        with self._lock:
+            for endpoint, ttl in self.ttls.items():
+                self._conn.execute(
+                    "DELETE FROM responses WHERE endpoint = ? AND stored_at < ?", (endpoint, now - ttl)
+                )
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {"entries": entries, "bytes": total, "hits": self.hits, "misses": self.misses, "mode": self.mode}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,337 @@
+#thin wrapper around the NCBI E-utilities that every part of the app talks to NCBI through
+#it keeps the cache in one place so the GUI search and the headless batch mode share the same responses,
+#sends every network request through the shared rate limited scheduler, and over the pooled keep-alive session
+#(Bio.Entrez is still used to parse the XML replies, but only imported once the first reply arrives - it is slow to import)
+import io
+import os
+import threading
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ThreadPoolExecutor
+
+from ncbi_cache import EntrezCache, normalize_term
+from ncbi_scheduler import SingleFlight, get_scheduler, wait_for
+from ncbi_transport import TOOL_NAME, get_session
+from fasta_stream import iter_fasta_file, parse_fasta_text
+from local_db import LocalDatabases
+from suggestions import SuggestionIndex
+from title_index import TitleIndex, header_document
+
+
+class StreamInterrupted(Exception):
+    #a streamed download failed after some of it had already been written - not retried here, since that would write those
+    #records twice (batch_search.fetch_chunk starts the whole chunk again instead)
+    pass
+
+
+class EntrezError(RuntimeError):
+    #NCBI answered 200 but the reply is an <ERROR> (e.g. "Search Backend failed") - a RuntimeError, as Bio.Entrez raises for them
+    pass
+
+
+class NCBIClient:
+    def __init__(self, email="", cache=None, api_key=None, scheduler=None, session=None, local_dbs=None, title_index=None,
+                 similarity_index=None, suggestions=None):
+        self.email = email
+        self.api_key = api_key
+        self.cache = cache if cache is not None else EntrezCache()
+        self.scheduler = scheduler if scheduler is not None else get_scheduler()
+        self.session = session if session is not None else get_session()
+        self.local_dbs = local_dbs if local_dbs is not None else LocalDatabases() #imported FASTA files, checked before efetch
+        self.title_index = title_index if title_index is not None else TitleIndex() #keyword index of every title seen, for offline name search
+        self.suggestions = suggestions if suggestions is not None else SuggestionIndex() #past searches and titles, for type-ahead
+        self._similarity_index = similarity_index #k-mer sketches of every sequence seen, opened on first use since it needs NumPy
+        self.inflight = SingleFlight() #identical lookups running at the same time share one request
+        self._index_lock = threading.Lock()
+        self._indexer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index") #sketches fetched sequences off the search path
+        if api_key:
+            self.scheduler.set_api_key(True)
+
+    def _request(self, endpoint, params, post, progress=None):
+        #runs on one of the scheduler's worker threads - NCBI wants the tool name and the user's email on every request
+        params = dict(params, tool=TOOL_NAME, email=self.email or None, api_key=self.api_key)
+        return self.session.request(endpoint, params, post=post, progress=progress)
+
+    def _call(self, endpoint, token=None, post=None, progress=None, **params):
+        #progress(received, total) follows the bytes of the reply as they arrive, see EutilsSession.stream
+        return wait_for(self.scheduler.submit(self._request, endpoint, params, post, progress), token)
+
+    def _stream(self, endpoint, params, on_chunk):
+        #runs on one of the scheduler's worker threads - a failure before the first byte is retried by the scheduler as normal
+        started = []
+
+        def sink(chunk):
+            started.append(True)
+            on_chunk(chunk)
+
+        try:
+            params = dict(params, tool=TOOL_NAME, email=self.email or None, api_key=self.api_key)
+            return self.session.stream(endpoint, params, sink)
+        except Exception as e:
+            if started:
+                raise StreamInterrupted(f"Download interrupted: {e}") from e
+            raise
+
+    def _cached(self, endpoint, key, loader, token=None, label=None):
+        #cache lookup + download on a miss, shared between identical lookups that are in flight at the same time
+        #label describes the lookup for the CacheMiss message, see EntrezCache.fetch
+        #the reply is checked before the cache stores it, so an error reply fails this lookup only instead of the whole TTL
+        future = self.inflight.submit((endpoint, key), lambda: self.cache.fetch(endpoint, key, lambda: check_reply(loader()), label))
+        return wait_for(future, token)
+
+    #single record lookups - these all go through the cache
+    #token is an optional CancelToken, once it is cancelled the call raises SearchCancelled instead of waiting any longer
+    #progress is an optional progress(received, total) callback for the download - it is never called for cached answers
+
+    def esearch(self, term, retmax=5, token=None, progress=None):
+        #returns the list of protein UIDs matching a free text term
+        raw = self._cached(
+            "esearch", f"{normalize_term(term)}|{retmax}",
+            lambda: self._call("esearch.fcgi", progress=progress, db="protein", term=term, retmax=retmax), token,
+            f"The search '{term}'"
+        )
+        ids = list(parse_xml(raw)["IdList"])
+        if ids:
+            self.suggestions.add_query(term) #only searches that found something are worth suggesting again
+        return ids
+
+    def esearch_count(self, term, token=None):
+        #number of protein records matching a term, without their UIDs
+        raw = self._cached(
+            "esearch", f"{normalize_term(term)}|count",
+            lambda: self._call("esearch.fcgi", db="protein", term=term, rettype="count"), token,
+            f"The hit count for '{term}'"
+        )
+        return int(parse_xml(raw)["Count"])
+
+    def espell(self, term, token=None):
+        #NCBI's spelling correction for a term - returns the corrected term, or the term itself if there was nothing to correct
+        raw = self._cached("espell", normalize_term(term), lambda: self._call("espell.fcgi", db="protein", term=term), token,
+                           f"The spelling check for '{term}'")
+        #parsed with ElementTree - the reply is tiny and Bio.Entrez would fetch its DTD if the declared one isn't bundled
+        corrected = ElementTree.fromstring(raw).findtext("CorrectedQuery")
+        return corrected.strip() if corrected and corrected.strip() else term
+
+    def esummary(self, uids, token=None, progress=None):
+        #uids can be one UID or a list - a list is fetched with a single comma joined request and returns one record per UID
+        ids = ",".join([uids] if isinstance(uids, str) else uids)
+        raw = self._cached(
+            "esummary", ids,
+            lambda: self._call("esummary.fcgi", progress=progress, db="protein", id=ids), token,
+            f"The summary of {ids}"
+        )
+        return self._index_summaries(parse_xml(raw))
+
+    def _index_summaries(self, summaries):
+        #every summary that comes back is added to the offline title index (ones already there are skipped) and its title to the
+        #type-ahead suggestions - titles are indexed without their "[Organism]" part, the organism has a field of its own
+        self.suggestions.add_titles(plain_title(str(r.get("Title", ""))) for r in summaries)
+        self.title_index.add_records([
+            {"accession": str(r.get("AccessionVersion", "")), "uid": str(r.get("Id", "")),
+             "title": plain_title(str(r.get("Title", ""))), "organism": record_organism(r, ""), "length": record_length(r, None)}
+            for r in summaries
+        ])
+        return summaries
+
+    def local_search(self, term, retmax=5):
+        #offline replacement for esearch + esummary - returns esummary style records from the title index, best match first
+        records = []
+        for doc in self.title_index.search(term, limit=retmax):
+            title = plain_title(doc["title"]) #indexes made before titles were stored without the organism still have it
+            organism = "" if doc["organism"] == "N/A" else doc["organism"]
+            title = f"{title} [{organism}]" if organism else title
+            records.append({
+                "Id": doc["uid"] or doc["accession"], #efetch accepts accessions too, for records that only came from a local file
+                "AccessionVersion": doc["accession"], "Caption": doc["accession"].split(".")[0],
+                "Title": title, "Organism": organism, "Length": doc["length"] or "N/A",
+            })
+        return records
+
+    @property
+    def similarity_index(self):
+        with self._index_lock: #opened from the indexer thread and search threads, only one of them may create it
+            if self._similarity_index is None:
+                from similarity_search import SimilarityIndex
+                self._similarity_index = SimilarityIndex()
+            return self._similarity_index
+
+    def import_local_fasta(self, fasta_path, progress=None):
+        #adds a local FASTA file for offline sequence lookups, its headers to the title index for offline name search and its
+        #sequences to the similarity index - progress(done, total) covers both passes over the file
+        name = os.path.basename(fasta_path)
+        count = self.local_dbs.import_fasta(
+            fasta_path, progress=progress and (lambda done, total: progress(done, 2 * total)),
+            on_headers=lambda headers: self._index_headers(headers, name)
+        )
+        self._sketch_local_fasta(fasta_path, name, count, progress)
+        return count
+
+    def _index_headers(self, headers, source):
+        documents = [header_document(h) for h in headers]
+        self.title_index.add_records(documents, source=source)
+        self.suggestions.add_titles(d["title"] for d in documents)
+
+    def fill_suggestions(self):
+        #a new suggestion index starts with the titles already in the title index (from before type-ahead existed)
+        #returns how many were added - slow for a big index, so call it off the main thread
+        if len(self.suggestions) or not len(self.title_index):
+            return 0
+        return self.suggestions.add_titles(plain_title(title) for title in self.title_index.titles())
+
+    def _sketch_local_fasta(self, fasta_path, name, count, progress=None, batch_size=20000):
+        #second pass of an import - sketches are worked out batch_size records at a time across the process pool, the residues
+        #themselves stay in the FASTA file (keep_residues=False) and are read back through local_dbs if they need rescoring
+        from similarity_search import sketch_many
+        batch = []
+        done = 0
+
+        def flush():
+            index = self.similarity_index
+            new = [r for r in batch if r["accession"] not in index]
+            if new:
+                index.add_records(new, source=name, keep_residues=False, sketches=sketch_many([r["residues"] for r in new]))
+            batch.clear()
+
+        for header, residues in iter_fasta_file(fasta_path):
+            parts = header.split(None, 1)
+            batch.append({"accession": header_document(header)["accession"], "title": parts[1] if len(parts) > 1 else "",
+                          "residues": residues})
+            done += 1
+            if len(batch) >= batch_size:
+                flush()
+                if progress:
+                    progress(count + done, 2 * count)
+        flush()
+        if progress:
+            progress(2 * count, 2 * count)
+
+    def efetch_fasta(self, uid, token=None, progress=None):
+        raw = self._cached(
+            "efetch", f"{uid}:fasta",
+            lambda: self._call("efetch.fcgi", progress=progress, db="protein", id=uid, rettype="fasta", retmode="text"), token,
+            f"The sequence of {uid}"
+        )
+        return raw.decode("utf-8")
+
+    def fetch_fasta(self, record, token=None, progress=None):
+        #FASTA for an esummary record - served from an imported local FASTA file if it has this accession, otherwise efetch
+        local = self.local_dbs.lookup_fasta(str(record.get("AccessionVersion", "")), str(record.get("Caption", "")))
+        if local is not None:
+            return local #already in the similarity index from when the file was imported
+        fasta = self.efetch_fasta(str(record.get("Id")), token=token, progress=progress)
+        self._indexer.submit(self._index_sequence, record, fasta) #sketching a huge sequence takes longer than parsing it
+        return fasta
+
+    def _index_sequence(self, record, fasta):
+        #every fetched sequence is sketched for similarity search, with its residues kept since the cache can evict them
+        #runs on the indexer thread, so a failure here only means this sequence can't be found by similarity search
+        records = parse_fasta_text(fasta)
+        accession = str(record.get("AccessionVersion", "")) or (records[0][0].split(None, 1)[0] if records else "")
+        if len(records) != 1 or not accession or accession in self.similarity_index:
+            return
+        self.similarity_index.add_records([{"accession": accession, "uid": str(record.get("Id", "")),
+                                            "title": str(record.get("Title", "")), "residues": records[0][1]}])
+
+    def wait_for_indexing(self):
+        #blocks until every fetched sequence handed to the indexer thread so far has been sketched
+        self._indexer.submit(lambda: None).result()
+
+    def similar_sequences(self, residues, limit=20, rescore=50, exclude=None, token=None):
+        #esummary style records for the fetched/imported sequences most similar to residues, best first
+        #candidates are ranked by k-mer similarity, then the top rescore of them by local alignment score (rescore=0 skips that)
+        #token is a CancelToken, checked before and during the rescoring
+        #each record has a "Similarity" (0-1 k-mer estimate) and, when rescored, an "AlignmentScore"
+        from similarity_search import align_scores
+        candidates = self.similarity_index.search(residues, limit=max(limit, rescore), exclude=exclude)
+        if rescore and candidates:
+            if token is not None:
+                token.check()
+            top, rest = candidates[:rescore], candidates[rescore:]
+            stored = self.similarity_index.residues([c["accession"] for c in top])
+            targets = []
+            for candidate in top:
+                sequence = stored.get(candidate["accession"])
+                if sequence is None:
+                    local = self.local_dbs.lookup_fasta(candidate["accession"])
+                    sequence = parse_fasta_text(local)[0][1] if local else ""
+                targets.append(sequence)
+            for candidate, score in zip(top, align_scores(residues, targets, token=token)):
+                candidate["score"] = score
+            top.sort(key=lambda c: c["score"], reverse=True)
+            candidates = top + rest
+        records = []
+        for candidate in candidates[:limit]:
+            record = {
+                "Id": candidate["uid"] or candidate["accession"],
+                "AccessionVersion": candidate["accession"], "Caption": candidate["accession"].split(".")[0],
+                "Title": candidate["title"], "Length": candidate["length"], "Similarity": round(candidate["similarity"], 3),
+            }
+            if "score" in candidate:
+                record["AlignmentScore"] = candidate["score"]
+            records.append(record)
+        return records
+
+    #history server (WebEnv) calls used for batches - these are tied to one NCBI session so they are never cached
+
+    def epost(self, ids):
+        #uploads a list of UIDs/accessions to the history server and returns (webenv, query_key) to refer to them later
+        result = parse_xml(self._call("epost.fcgi", post=True, db="protein", id=",".join(ids)))
+        return result["WebEnv"], result["QueryKey"]
+
+    def esummary_history(self, webenv, query_key, retstart, retmax):
+        raw = self._call(
+            "esummary.fcgi", db="protein", webenv=webenv, query_key=query_key, retstart=retstart, retmax=retmax
+        )
+        return self._index_summaries(parse_xml(raw))
+
+    def efetch_fasta_stream(self, on_chunk, ids=None, webenv=None, query_key=None, retstart=None, retmax=None, token=None):
+        #streams FASTA for a list of ids (or a history server query) to on_chunk(bytes) as it arrives - nothing is kept in memory or cached
+        #returns the number of bytes streamed
+        params = {"db": "protein", "rettype": "fasta", "retmode": "text",
+                  "webenv": webenv, "query_key": query_key, "retstart": retstart, "retmax": retmax}
+        if ids is not None:
+            params["id"] = ",".join(ids)
+        return wait_for(self.scheduler.submit(self._stream, "efetch.fcgi", params, on_chunk), token)
+
+
+def check_reply(raw):
+    #raises EntrezError for an XML reply carrying an <ERROR> element, otherwise returns raw - FASTA text is never XML
+    if raw[:100].lstrip().startswith(b"<"):
+        start = raw.find(b"<ERROR>")
+        if start != -1:
+            end = raw.find(b"</ERROR>", start)
+            message = raw[start + len(b"<ERROR>"):end if end != -1 else None].decode("utf-8", "replace").strip()
+            raise EntrezError(f"NCBI returned an error: {message or 'no details'}")
+    return raw
+
+
+def parse_xml(raw):
+    #E-utilities XML reply -> Bio.Entrez records
+    from Bio import Entrez
+    return Entrez.read(io.BytesIO(raw))
+
+
+def plain_title(title):
+    #"Hemoglobin subunit beta [Homo sapiens]" -> "Hemoglobin subunit beta"
+    if title.endswith("]") and "[" in title:
+        return title[:title.rindex("[")].strip()
+    return title
+
+
+def record_organism(record, default="N/A"):
+    #protein esummary records don't always carry an Organism field, but the title ends with "[Homo sapiens]" style text
+    organism = record.get("Organism")
+    if organism:
+        return str(organism)
+    title = str(record.get("Title", ""))
+    if title.endswith("]") and "[" in title:
+        return title[title.rindex("[") + 1:-1]
+    return default
+
+
+def record_length(record, default=""):
+    #the esummary Length as a plain int - Bio.Entrez parses it as an IntegerElement, whose str() is its repr
+    #("IntegerElement(141, attributes={})") - default when it is missing or not a number (e.g. "N/A")
+    try:
+        return int(record.get("Length"))
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,209 @@
+#one shared scheduler that every NCBI request goes through
+#NCBI allows 3 requests per second (10 with an API key) per user, so rather than letting every search thread hit NCBI on its own,
+#requests are queued, run on a small pool of worker threads, spaced out by a token bucket and retried with backoff on 429/5xx errors
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from urllib.error import HTTPError, URLError
+
+
+RATE_NO_KEY = 3 #requests per second allowed without an API key
+RATE_WITH_KEY = 10 #requests per second allowed with an API key
+
+
+class TokenBucket:
+    #classic token bucket - tokens refill at 'rate' per second up to 'capacity', each request takes one token
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        #blocks until a token is available
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_retryable(error):
+    #429 (too many requests) and server side 5xx errors are worth trying again, other 4xx errors mean the request itself is wrong
+    if isinstance(error, HTTPError):
+        return error.code == 429 or error.code >= 500
+    return isinstance(error, (URLError, ConnectionError, TimeoutError))
+
+
+class RequestScheduler:
+    def __init__(self, api_key=False, max_workers=4, max_retries=5, base_delay=0.5, max_delay=30.0):
+        self.bucket = TokenBucket(RATE_WITH_KEY if api_key else RATE_NO_KEY)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_workers = max_workers #requests that can be in flight at once
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ncbi")
+        self._lock = threading.Lock()
+        self.queued = 0 #submitted but not started yet
+        self.active = 0 #currently talking to NCBI (or backing off)
+        self.completed = 0
+        self.retries = 0
+        self.failures = 0
+
+    def set_api_key(self, has_key):
+        self.bucket.set_rate(RATE_WITH_KEY if has_key else RATE_NO_KEY)
+
+    @property
+    def queue_depth(self):
+        with self._lock:
+            return self.queued
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queued": self.queued, "active": self.active, "completed": self.completed,
+                "retries": self.retries, "failures": self.failures, "rate": self.bucket.rate,
+            }
+
+    def submit(self, function, *args, **kwargs):
+        #queues a request and returns a Future straight away
+        with self._lock:
+            self.queued += 1
+        return self._pool.submit(self._run, function, args, kwargs)
+
+    def call(self, function, *args, **kwargs):
+        #queues a request and waits for its result (or re-raises its error)
+        return self.submit(function, *args, **kwargs).result()
+
+    def _backoff(self, attempt, error):
+        #NCBI sometimes says how long to wait, otherwise exponential backoff with full jitter so retries don't line up
+        retry_after = getattr(error, "headers", None) and error.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(self.max_delay, float(retry_after))
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _run(self, function, args, kwargs):
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            attempt = 0
+            while True:
+                self.bucket.acquire() #every attempt, including retries, counts against the rate limit
+                try:
+                    result = function(*args, **kwargs)
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        with self._lock:
+                            self.failures += 1
+                        raise
+                    with self._lock:
+                        self.retries += 1
+                    time.sleep(self._backoff(attempt, e))
+                    attempt += 1
+                else:
+                    with self._lock:
+                        self.completed += 1
+                    return result
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class SearchCancelled(Exception):
+    #raised inside a search thread once its CancelToken has been cancelled - the search just stops quietly
+    pass
+
+
+class CancelToken:
+    #one per search - the GUI cancels it when a newer search replaces this one, the search thread checks it between stages
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise SearchCancelled()
+
+
+def wait_for(future, token=None, poll=0.05):
+    #waits for a Future, but gives up as soon as the token is cancelled (the request itself carries on, its result just isn't wanted here)
+    if token is None:
+        return future.result()
+    while True:
+        token.check()
+        try:
+            return future.result(timeout=poll)
+        except FutureTimeout:
+            pass
+
+
+class SingleFlight:
+    #makes identical requests that are running at the same time share one piece of work
+    #the first caller for a key starts it, everyone else asking for the same key gets the same Future back
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def submit(self, key, function):
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            future = Future()
+            self._inflight[key] = future
+        #the work runs on its own thread so that cancelling one waiting search never cancels the request for the others sharing it
+        threading.Thread(target=self._run, args=(key, function, future), daemon=True).start()
+        return future
+
+    def _run(self, key, function, future):
+        try:
+            result = function()
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._inflight)
+
+
+_shared_scheduler = None
+_shared_lock = threading.Lock()
+
+
+def get_scheduler():
+    #the app and batch mode share one scheduler per process, otherwise two schedulers could each use the full rate limit
+    global _shared_scheduler
+    with _shared_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = RequestScheduler()
+        return _shared_scheduler
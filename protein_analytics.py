@@ -0,0 +1,172 @@
+#physicochemical properties of protein sequences - composition, molecular weight, isoelectric point (pI), GRAVY and
+#extinction coefficient - computed with NumPy instead of a Python loop per residue
+#residues are encoded into a uint8 array once and every property comes from lookup tables over per-sequence residue counts,
+#and a whole multi-FASTA batch is handled as one ragged array (all residues concatenated + the length of each sequence)
+#
+#usage: python protein_analytics.py sequences.fasta --out report.tsv
+import argparse
+
+import numpy as np
+
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+OTHER = len(AMINO_ACIDS) #code for anything that isn't one of the 20 standard residues (X, B, Z, U, *, ...)
+N_CODES = OTHER + 1
+
+#ASCII byte -> residue code, upper and lower case
+CODE_TABLE = np.full(256, OTHER, dtype=np.uint8)
+for _code, _aa in enumerate(AMINO_ACIDS):
+    CODE_TABLE[ord(_aa)] = _code
+    CODE_TABLE[ord(_aa.lower())] = _code
+
+#average residue masses in Da (amino acid minus water, as ExPASy ProtParam uses)
+RESIDUE_MASS = np.zeros(N_CODES)
+RESIDUE_MASS[:OTHER] = [
+    71.0788, 103.1388, 115.0886, 129.1155, 147.1766, 57.0519, 137.1411, 113.1594, 128.1741, 113.1594,
+    131.1926, 114.1038, 97.1167, 128.1307, 156.1875, 87.0782, 101.1051, 99.1326, 186.2132, 163.1760,
+]
+WATER_MASS = 18.01524
+
+#Kyte-Doolittle hydropathy
+HYDROPATHY = np.zeros(N_CODES)
+HYDROPATHY[:OTHER] = [
+    1.8, 2.5, -3.5, -3.5, 2.8, -0.4, -3.2, 4.5, -3.9, 3.8,
+    1.9, -3.5, -1.6, -3.5, -4.5, -0.8, -0.7, 4.2, -0.9, -1.3,
+]
+
+#pKa values for the charged groups (the set Biopython's IsoelectricPoint uses, without its residue specific terminal values)
+PK_N_TERM, PK_C_TERM = 7.5, 3.55
+PK_POSITIVE = {"K": 10.0, "R": 12.0, "H": 5.98}
+PK_NEGATIVE = {"D": 4.05, "E": 4.45, "C": 9.0, "Y": 10.0}
+
+#molar extinction coefficients at 280 nm (Pace et al.)
+EXT_W, EXT_Y, EXT_CYSTINE = 5500, 1490, 125
+
+COLUMNS = ["length", "molecular_weight", "pI", "gravy", "extinction_coefficient", "extinction_coefficient_cystines"] + \
+    [f"pct_{aa}" for aa in AMINO_ACIDS]
+
+
+def encode(sequence):
+    #residue codes (uint8) for one sequence - str or bytes
+    if isinstance(sequence, str):
+        sequence = sequence.encode("ascii", "replace")
+    return CODE_TABLE[np.frombuffer(sequence, dtype=np.uint8)]
+
+
+def residue_counts(sequences):
+    #(n_sequences, N_CODES) count matrix for a list of sequences, in one pass over the concatenated residues
+    lengths = np.fromiter((len(s) for s in sequences), dtype=np.int64, count=len(sequences))
+    if not len(sequences):
+        return np.zeros((0, N_CODES), dtype=np.int64)
+    codes = encode("".join(sequences) if isinstance(sequences[0], str) else b"".join(sequences))
+    owner = np.repeat(np.arange(len(sequences)), lengths) #which sequence each residue belongs to
+    flat = np.bincount(owner * N_CODES + codes, minlength=len(sequences) * N_CODES)
+    return flat.reshape(len(sequences), N_CODES)
+
+
+def isoelectric_points(counts, iterations=40):
+    #pI for every row of a count matrix at once - bisection on the net charge, all sequences in step
+    col = {aa: AMINO_ACIDS.index(aa) for aa in AMINO_ACIDS}
+    low = np.zeros(len(counts))
+    high = np.full(len(counts), 14.0)
+    for _ in range(iterations):
+        ph = (low + high) / 2
+        positive = 1 / (1 + 10 ** (ph - PK_N_TERM))
+        for aa, pk in PK_POSITIVE.items():
+            positive = positive + counts[:, col[aa]] / (1 + 10 ** (ph - pk))
+        negative = 1 / (1 + 10 ** (PK_C_TERM - ph))
+        for aa, pk in PK_NEGATIVE.items():
+            negative = negative + counts[:, col[aa]] / (1 + 10 ** (pk - ph))
+        charged = positive > negative
+        low = np.where(charged, ph, low)
+        high = np.where(charged, high, ph)
+    return (low + high) / 2
+
+
+def analyze_batch(sequences):
+    #dict of column name -> NumPy array (one value per sequence), see COLUMNS
+    counts = residue_counts(sequences)
+    standard = counts[:, :OTHER].sum(axis=1)
+    safe = np.maximum(standard, 1)
+    w, y, c = (counts[:, AMINO_ACIDS.index(aa)] for aa in "WYC")
+    results = {
+        "length": counts.sum(axis=1),
+        "molecular_weight": np.where(standard > 0, counts @ RESIDUE_MASS + WATER_MASS, 0.0),
+        "pI": np.where(standard > 0, isoelectric_points(counts), np.nan),
+        "gravy": (counts @ HYDROPATHY) / safe,
+        "extinction_coefficient": w * EXT_W + y * EXT_Y, #all cysteines reduced
+        "extinction_coefficient_cystines": w * EXT_W + y * EXT_Y + (c // 2) * EXT_CYSTINE, #all cysteine pairs form cystines
+    }
+    percent = counts[:, :OTHER] * 100.0 / safe[:, None]
+    for i, aa in enumerate(AMINO_ACIDS):
+        results[f"pct_{aa}"] = percent[:, i]
+    return results
+
+
+def analyze(sequence):
+    #the same properties for a single sequence, as plain Python numbers
+    results = analyze_batch([sequence])
+    return {name: values[0].item() for name, values in results.items()}
+
+
+def summary_text(props):
+    #short human readable lines for the info panel
+    top = sorted(AMINO_ACIDS, key=lambda aa: props[f"pct_{aa}"], reverse=True)[:5]
+    return (
+        f"Mol. weight: {props['molecular_weight']:,.1f} Da   pI: {props['pI']:.2f}   GRAVY: {props['gravy']:.3f}\n"
+        f"Ext. coefficient (280 nm): {props['extinction_coefficient']:,} M-1 cm-1 "
+        f"({props['extinction_coefficient_cystines']:,} with cystines)\n"
+        f"Composition: " + ", ".join(f"{aa} {props[f'pct_{aa}']:.1f}%" for aa in top)
+    )
+
+
+INTEGER_COLUMNS = {"length", "extinction_coefficient", "extinction_coefficient_cystines"}
+
+
+def report_lines(names, results):
+    #one tab separated line per sequence, in COLUMNS order
+    for i, name in enumerate(names):
+        row = [name.replace("\t", " ")]
+        for column in COLUMNS:
+            value = results[column][i]
+            row.append(str(int(value)) if column in INTEGER_COLUMNS else f"{value:.4f}")
+        yield "\t".join(row) + "\n"
+
+
+def write_report(names, results, path):
+    #tab separated table, one row per sequence
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\t".join(["name"] + COLUMNS) + "\n")
+        f.writelines(report_lines(names, results))
+
+
+def report_fasta(fasta_path, out_path, batch_size=50000):
+    #analyses a multi-FASTA file batch_size records at a time (each batch is one vectorised pass) - returns the number of records
+    from fasta_stream import iter_fasta_file
+    total = 0
+    names, sequences = [], []
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write("\t".join(["name"] + COLUMNS) + "\n")
+        for header, sequence in iter_fasta_file(fasta_path):
+            names.append(header.split(None, 1)[0] if header.strip() else "")
+            sequences.append(sequence)
+            total += 1
+            if len(sequences) >= batch_size:
+                f.writelines(report_lines(names, analyze_batch(sequences)))
+                names, sequences = [], []
+        if sequences:
+            f.writelines(report_lines(names, analyze_batch(sequences)))
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Physicochemical report for every protein in a FASTA file")
+    parser.add_argument("input", help="FASTA file (can be .gz)")
+    parser.add_argument("--out", default="protein_report.tsv", help="output table")
+    args = parser.parse_args(argv)
+    count = report_fasta(args.input, args.out)
+    print(f"{count} sequences analysed, report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
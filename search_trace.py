@@ -0,0 +1,172 @@
+#per stage timing of every search (esearch, esummary, efetch, parse, render) so a slow search can be pinned on NCBI, the network
+#or Tk - each finished search is appended to a JSON lines trace file and kept in memory for the in-app latency histogram
+#network stages also record when the first byte of the reply arrived: the time before it is queueing (rate limit) + NCBI working
+#out the answer + the round trip, the time after it is the transfer itself
+import json
+import math
+import os
+import threading
+import time
+
+
+DEFAULT_TRACE_PATH = os.path.join(os.path.expanduser("~"), ".protein_app", "search_trace.jsonl")
+MAX_TRACE_BYTES = 5 * 1024 * 1024 #the trace file is rotated to search_trace.jsonl.1 past this
+STAGES = ("esearch", "esummary", "efetch", "parse", "render", "total")
+NOT_SEARCHES = {"startup", "recall"} #trace kinds left out of the histogram (app startup, proteins shown again from memory)
+HISTORY = 500 #searches kept in memory (and reloaded from the trace file the first time the histogram is needed) for the histogram
+
+
+class Stage:
+    #timing of one stage - also the progress(received, total) callback passed down to the transport, which calls it with
+    #received=0 when the reply's headers arrive and then after every chunk of the body
+    def __init__(self, name, on_bytes=None):
+        self.name = name
+        self.on_bytes = on_bytes
+        self.start = time.perf_counter()
+        self.first_byte = None
+        self.end = None
+        self.bytes = 0
+        self.expected = None #Content-Length, when the server sent one
+
+    def progress(self, received, total):
+        if self.first_byte is None:
+            self.first_byte = time.perf_counter()
+        self.bytes = received
+        self.expected = total
+        if self.on_bytes:
+            self.on_bytes(received, total)
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    def to_dict(self):
+        end = self.end if self.end is not None else time.perf_counter()
+        result = {"ms": round((end - self.start) * 1000, 2)}
+        if self.first_byte is not None:
+            result["wait_ms"] = round((self.first_byte - self.start) * 1000, 2)
+            result["transfer_ms"] = round((end - self.first_byte) * 1000, 2)
+            result["bytes"] = self.bytes
+        elif self.name in ("esearch", "esummary", "efetch"):
+            result["cached"] = True #answered from the cache or a local FASTA file, nothing went over the network
+        return result
+
+
+class SearchTrace:
+    #the stages of one search - use "with trace.stage('esearch') as stage:" around each step
+    def __init__(self, query, kind="search"):
+        self.query = query
+        self.kind = kind
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.stages = {}
+        self.status = None
+
+    def stage(self, name, on_bytes=None):
+        stage = Stage(name, on_bytes)
+        self.stages[name] = stage
+        return _StageContext(stage)
+
+    def begin(self, name):
+        #for stages that end in a callback rather than a with block (rendering) - call finish() on the result
+        stage = Stage(name)
+        self.stages[name] = stage
+        return stage
+
+    def to_dict(self):
+        return {
+            "time": round(self.started, 3), "kind": self.kind, "query": self.query, "status": self.status,
+            "total_ms": round((time.perf_counter() - self._start) * 1000, 2),
+            "stages": {name: stage.to_dict() for name, stage in self.stages.items()},
+        }
+
+
+class _StageContext:
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        return self.stage
+
+    def __exit__(self, *exc):
+        self.stage.finish()
+        return False
+
+
+class TraceLog:
+    def __init__(self, path=DEFAULT_TRACE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._recent = None #the last HISTORY finished traces as dicts, oldest first - read from the file when first needed, not at startup
+
+    @property
+    def recent(self):
+        #caller holds the lock
+        if self._recent is None:
+            self._recent = []
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path, encoding="utf-8") as f:
+                        for line in f.readlines()[-HISTORY:]:
+                            self._recent.append(json.loads(line))
+                except (OSError, ValueError):
+                    self._recent = [] #an unreadable trace only loses the old histogram, never the app
+        return self._recent
+
+    def record(self, trace, status):
+        #finishes a search's trace - appends it to the JSON lines file and the in memory history, returns the dict written
+        trace.status = status
+        return self.append(trace.to_dict())
+
+    def append(self, entry):
+        #writes any trace dict (e.g. the app's startup report)
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            self.recent.append(entry)
+            del self.recent[:-HISTORY]
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                if os.path.exists(self.path) and os.path.getsize(self.path) > MAX_TRACE_BYTES:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError:
+                pass #tracing must never break a search
+        return entry
+
+    def durations(self, stage):
+        #milliseconds of every recent successful search for one stage ("total" for the whole search)
+        with self._lock:
+            entries = [e for e in self.recent if e.get("status") == "ok" and e.get("kind") not in NOT_SEARCHES]
+        if stage == "total":
+            return [e["total_ms"] for e in entries]
+        return [e["stages"][stage]["ms"] for e in entries if stage in e.get("stages", {})]
+
+    def histogram_text(self, width=40):
+        #text histogram of every stage on a log scale (1 ms .. 100 s buckets) with the median and 95th percentile
+        lines = []
+        edges = [10 ** (i / 2) for i in range(11)] #1, 3.2, 10, 32 ... 100000 ms
+        for stage in STAGES:
+            values = sorted(self.durations(stage))
+            if not values:
+                continue
+            p50 = values[len(values) // 2]
+            p95 = values[min(len(values) - 1, math.ceil(len(values) * 0.95) - 1)]
+            lines.append(f"{stage}  (n={len(values)}, median {p50:.0f} ms, p95 {p95:.0f} ms)")
+            counts = [0] * len(edges)
+            for value in values:
+                bucket = next((i for i, edge in enumerate(edges) if value < edge), len(edges) - 1)
+                counts[bucket] += 1
+            biggest = max(counts)
+            low = 0
+            for edge, count in zip(edges, counts):
+                if count:
+                    bar = "#" * max(1, round(count * width / biggest))
+                    lines.append(f"  {_ms(low):>7} - {_ms(edge):<7} {bar} {count}")
+                low = edge
+            lines.append("")
+        return "\n".join(lines) or "No searches traced yet."
+
+
+def _ms(value):
+    return f"{value / 1000:.3g}s" if value >= 1000 else f"{value:.3g}ms"
@@ -0,0 +1,91 @@
+#rendering of (possibly very large) FASTA text into a textbox without freezing the Tk main loop
+#the residues are laid out in fixed width lines split into blocks of 10 (like NCBI's own sequence view), and the lines are
+#inserted a slice at a time through root.after, so the window keeps handling clicks and key presses while titin or a whole
+#multi-FASTA file is still being drawn
+import tkinter as tk
+
+
+LINE_WIDTH = 60 #residues per line
+BLOCK_SIZE = 10 #residues per space separated block
+LINES_PER_SLICE = 400 #lines inserted per main loop tick (~24k residues)
+
+
+def format_sequence_lines(residues, line_width=LINE_WIDTH, block_size=BLOCK_SIZE):
+    #yields "MVHLTPEEKS AVTALWGKVN ..." style lines for one record's residues
+    for start in range(0, len(residues), line_width):
+        line = residues[start:start + line_width]
+        yield " ".join(line[i:i + block_size] for i in range(0, len(line), block_size))
+
+
+def format_fasta(text, line_width=LINE_WIDTH, block_size=BLOCK_SIZE):
+    #yields display lines for FASTA text with any number of records - headers are kept as they are, residues are re-flowed into blocks
+    residues = []
+    for line in text.splitlines():
+        if line.startswith(">"):
+            if residues:
+                yield from format_sequence_lines("".join(residues), line_width, block_size)
+                residues = []
+                yield "" #blank line between records
+            yield line
+        else:
+            residues.append(line.strip())
+    if residues:
+        yield from format_sequence_lines("".join(residues), line_width, block_size)
+
+
+class ChunkedRenderer:
+    #inserts lines into a textbox a slice at a time - starting a new render cancels the one still in progress
+    def __init__(self, root, textbox, lines_per_slice=LINES_PER_SLICE):
+        self.root = root
+        self.textbox = textbox
+        self.lines_per_slice = lines_per_slice
+        self._lines = None
+        self._job = None
+        self._on_done = None
+        self._on_slice = None
+        self._drawn = 0
+
+    @property
+    def busy(self):
+        return self._lines is not None
+
+    def render(self, lines, on_done=None, on_slice=None):
+        #lines can be any iterable (e.g. format_fasta(...)) - it is only consumed as fast as it is drawn
+        #on_slice(lines_drawn_so_far) is called after every slice that isn't the last one
+        self.cancel()
+        self.textbox.delete("1.0", tk.END)
+        self._lines = iter(lines)
+        self._on_done = on_done
+        self._on_slice = on_slice
+        self._drawn = 0
+        self._step()
+
+    def cancel(self):
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+        self._job = None
+        self._lines = None
+        self._on_done = None
+        self._on_slice = None
+
+    def _step(self):
+        self._job = None
+        chunk = []
+        for line in self._lines:
+            chunk.append(line)
+            if len(chunk) >= self.lines_per_slice:
+                break
+        if chunk:
+            self.textbox.insert(tk.END, "\n".join(chunk) + "\n") #one insert per slice, never one per line
+            self._drawn += len(chunk)
+        if len(chunk) >= self.lines_per_slice:
+            if self._on_slice:
+                self._on_slice(self._drawn)
+            self._job = self.root.after(1, self._step) #give the main loop a chance to redraw and handle events before the next slice
+            return
+        on_done = self._on_done
+        self._lines = None
+        self._on_done = None
+        self._on_slice = None
+        if on_done:
+            on_done()
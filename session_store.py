@@ -0,0 +1,149 @@
+#history of every protein fetched this session, so going back to an earlier one is instant and needs no network request
+#records are small __slots__ objects: residues are kept as ASCII bytes (1 byte per residue instead of a str's FASTA text with
+#line breaks), organism names come from one shared pool, and past a memory ceiling the residues of the least recently viewed
+#records are spilled to a temporary file and read back with one seek + read when they are recalled
+#everything is gone when the app closes - the on-disk caches are what persists between sessions
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+DEFAULT_MEMORY_LIMIT = int(float(os.environ.get("PROTEIN_APP_SESSION_MB", "64")) * 1024 * 1024) #residue bytes kept in RAM
+FASTA_WIDTH = 70 #residues per line when the FASTA text is rebuilt, the same as NCBI's efetch
+RECORD_OVERHEAD = 200 #rough bytes per record for the object, its strings and the dict entries
+
+
+class SessionRecord:
+    __slots__ = ("accession", "uid", "title", "organism", "length", "header", "residues", "spill_offset", "spill_size")
+
+    def __init__(self, accession, uid, title, organism, length, header, residues):
+        self.accession = accession
+        self.uid = uid
+        self.title = title
+        self.organism = organism
+        self.length = length
+        self.header = header
+        self.residues = residues #bytes, or None while spilled
+        self.spill_offset = None #where the residues are in the spill file, once they have been written there
+        self.spill_size = 0
+
+    def summary(self):
+        #esummary style record, as the rest of the app expects
+        return {"Id": self.uid or self.accession, "AccessionVersion": self.accession, "Caption": self.accession.split(".")[0],
+                "Title": self.title, "Organism": self.organism, "Length": self.length}
+
+
+class SessionStore:
+    def __init__(self, memory_limit=DEFAULT_MEMORY_LIMIT, spill_dir=None):
+        self.memory_limit = memory_limit
+        self.spill_dir = spill_dir
+        self._lock = threading.Lock()
+        self._records = {} #accession -> SessionRecord, in the order they were first fetched
+        self._resident = OrderedDict() #accessions whose residues are in RAM, least recently viewed first
+        self._organisms = {} #shared organism strings - thousands of records from a few species hold a few strings
+        self._spill = None #temporary file, made the first time anything is spilled
+        self._spill_end = 0
+        self.resident_bytes = 0
+        self.spills = 0
+        self.recalls = 0 #residues read back from the spill file
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, accession):
+        return accession in self._records
+
+    def add(self, summary, header, residues):
+        #stores (or refreshes) a fetched record - summary is its esummary record, residues a str or bytes - returns the SessionRecord
+        if isinstance(residues, str):
+            residues = residues.encode("ascii", "replace")
+        accession = str(summary.get("AccessionVersion", "")) or header.split(None, 1)[0]
+        organism = str(summary.get("Organism", "") or "")
+        with self._lock:
+            organism = self._organisms.setdefault(organism, organism)
+            old = self._records.pop(accession, None)
+            if old is not None:
+                self._drop_resident(old)
+            record = SessionRecord(accession, str(summary.get("Id", "")), str(summary.get("Title", "")), organism,
+                                   len(residues), header, residues)
+            if old is not None and old.spill_offset is not None and old.spill_size == len(residues):
+                #fetched again with the same residues - they are already in the spill file, so they aren't written twice
+                self._spill.seek(old.spill_offset)
+                if self._spill.read(old.spill_size) == residues:
+                    record.spill_offset, record.spill_size = old.spill_offset, old.spill_size
+            self._records[accession] = record
+            self._make_resident(record)
+        return record
+
+    def get(self, accession):
+        with self._lock:
+            return self._records.get(accession)
+
+    def recent(self, limit=None):
+        #records newest first
+        with self._lock:
+            records = list(self._records.values())
+        records.reverse()
+        return records[:limit] if limit else records
+
+    def residues(self, record):
+        #the record's residues as bytes - read back from the spill file if they were spilled, which makes them resident again
+        with self._lock:
+            if record.residues is None:
+                self._spill.seek(record.spill_offset)
+                record.residues = self._spill.read(record.spill_size)
+                self.recalls += 1
+                self._make_resident(record)
+            else:
+                self._resident.move_to_end(record.accession)
+            return record.residues
+
+    def fasta(self, record, width=FASTA_WIDTH):
+        residues = self.residues(record).decode("ascii")
+        lines = [f">{record.header}"] + [residues[i:i + width] for i in range(0, len(residues), width)]
+        return "\n".join(lines) + "\n"
+
+    def _make_resident(self, record):
+        #caller holds the lock - then spills the least recently viewed records until the residues fit under memory_limit again
+        self._resident[record.accession] = record
+        self.resident_bytes += len(record.residues)
+        while self.resident_bytes > self.memory_limit and len(self._resident) > 1:
+            _, oldest = self._resident.popitem(last=False)
+            self._spill_record(oldest)
+
+    def _drop_resident(self, record):
+        #caller holds the lock
+        if self._resident.pop(record.accession, None) is not None:
+            self.resident_bytes -= len(record.residues)
+
+    def _spill_record(self, record):
+        #caller holds the lock - residues that were spilled before are already in the file (they never change), so they are
+        #only written the first time
+        if record.spill_offset is None:
+            if self._spill is None:
+                self._spill = tempfile.TemporaryFile(prefix="protein_session_", dir=self.spill_dir)
+            self._spill.seek(self._spill_end)
+            self._spill.write(record.residues)
+            record.spill_offset, record.spill_size = self._spill_end, len(record.residues)
+            self._spill_end += len(record.residues)
+        self.resident_bytes -= len(record.residues)
+        record.residues = None
+        self.spills += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "records": len(self._records), "resident": len(self._resident), "resident_bytes": self.resident_bytes,
+                "spilled_bytes": self._spill_end, "organisms": len(self._organisms), "spills": self.spills,
+                "recalls": self.recalls,
+                "approx_ram_bytes": self.resident_bytes + sum(
+                    RECORD_OVERHEAD + len(r.header) + len(r.title) for r in self._records.values()
+                ),
+            }
+
+    def close(self):
+        with self._lock:
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
@@ -0,0 +1,318 @@
+#k-mer similarity search over every sequence the app has fetched or imported, to find close homologs of a hit without
+#exporting it to an external tool
+#each sequence is reduced to a small MinHash sketch of its 4-mers (SKETCH_SIZE uint32 values), so comparing a query against
+#100k sequences is one NumPy comparison over a (sequences x SKETCH_SIZE) matrix - the best candidates can then be rescored
+#with a Smith-Waterman local alignment that is vectorised across many targets at once and spread over a process pool
+import multiprocessing
+import os
+import sqlite3
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ncbi_scheduler import wait_for
+from protein_analytics import AMINO_ACIDS, OTHER, encode
+
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".protein_app", "similarity_index.sqlite3")
+K = 4 #k-mer length - 20^4 possible words, specific enough that unrelated proteins share few of them
+SKETCH_SIZE = 64 #hash functions per sketch - the similarity estimate is the fraction of the SKETCH_SIZE minimums two sequences share
+EMPTY = np.uint32(0xFFFFFFFF) #sketch value for a sequence too short to have any k-mers
+
+#multiply-shift hash functions, the top 32 bits of (a * kmer + b) mod 2^64 - no division, so hashing millions of k-mers is cheap
+#the seed is fixed so sketches stored on disk stay comparable between runs
+_rng = np.random.default_rng(0x5EED)
+HASH_A = _rng.integers(0, 1 << 63, SKETCH_SIZE, dtype=np.uint64) * np.uint64(2) + np.uint64(1) #odd multipliers
+HASH_B = _rng.integers(0, 1 << 63, SKETCH_SIZE, dtype=np.uint64)
+SHIFT = np.uint64(32)
+
+#local alignment scoring - BLOSUM62 with BLAST's default gap costs (a gap of length L costs GAP_OPEN + GAP_EXTEND * L)
+GAP_OPEN, GAP_EXTEND = 11, 1
+PAD = OTHER + 1 #code used to pad targets to the same length, it never scores
+PARALLEL_CELLS = 20_000_000 #alignments smaller than this (query length x total target length) aren't worth sending to other processes
+MAX_ALIGN_LENGTH = 4000 #longer queries and targets are aligned on their first MAX_ALIGN_LENGTH residues (titin would take minutes)
+BATCH_CELLS = 1_000_000 #targets x padded length per batch - bounds the DP arrays to ~25 MB and is how often a cancel is noticed
+
+
+def kmer_ids(sequences):
+    #(kmer ids, owner) for every k-mer of every sequence, in one pass over the concatenated residues - k-mers that cross from one
+    #sequence into the next or contain a non standard residue are left out, owner is the index of the sequence each k-mer came from
+    lengths = np.fromiter((len(s) for s in sequences), dtype=np.int64, count=len(sequences))
+    total = int(lengths.sum())
+    if total < K:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    codes = encode("".join(sequences)).astype(np.int64)
+    owner = np.repeat(np.arange(len(sequences)), lengths)
+    windows = total - K + 1
+    ids = np.zeros(windows, dtype=np.int64)
+    for offset in range(K):
+        ids = ids * len(AMINO_ACIDS) + np.minimum(codes[offset:offset + windows], len(AMINO_ACIDS) - 1)
+    unknown = np.concatenate(([0], np.cumsum(codes == OTHER)))
+    valid = (unknown[K:] == unknown[:-K]) & (owner[:windows] == owner[K - 1:])
+    return ids[valid], owner[:windows][valid]
+
+
+def sketch_batch(sequences):
+    #(len(sequences), SKETCH_SIZE) uint32 MinHash sketches - each column is the smallest hash of the sequence's k-mers under
+    #one hash function, taken for all sequences at once with minimum.reduceat over the concatenated k-mers
+    sketches = np.full((len(sequences), SKETCH_SIZE), EMPTY, dtype=np.uint32)
+    ids, owner = kmer_ids(sequences)
+    if not len(ids):
+        return sketches
+    counts = np.bincount(owner, minlength=len(sequences))
+    has_kmers = counts > 0
+    starts = (np.cumsum(counts) - counts)[has_kmers]
+    ids = ids.astype(np.uint64)
+    for j in range(SKETCH_SIZE):
+        hashes = (HASH_A[j] * ids + HASH_B[j]) >> SHIFT #uint64 arithmetic wraps around, which is the mod 2^64
+        sketches[has_kmers, j] = np.minimum.reduceat(hashes, starts)
+    return sketches
+
+
+def similarities(matrix, sketch):
+    #estimated k-mer Jaccard similarity (0-1) of one sketch against every row of a sketch matrix
+    if not len(matrix):
+        return np.zeros(0)
+    return ((matrix == sketch) & (sketch != EMPTY)).sum(axis=1) / SKETCH_SIZE
+
+
+def _score_table():
+    #(PAD + 1) x (PAD + 1) substitution scores indexed by residue code - non standard residues score as X, padding as very negative
+    from Bio.Align import substitution_matrices
+    blosum = substitution_matrices.load("BLOSUM62")
+    letters = AMINO_ACIDS + "X"
+    table = np.full((PAD + 1, PAD + 1), -1000, dtype=np.int32)
+    for i, a in enumerate(letters):
+        for j, b in enumerate(letters):
+            table[i, j] = int(blosum[a][b])
+    return table
+
+
+_scores = None
+
+
+def smith_waterman_batch(query, targets):
+    #best local alignment score of query against each target, using affine gaps
+    #the targets are padded into one (targets x length) array and the dynamic programming runs a query residue (a row) at a time
+    #over all of them - the horizontal gap dependency within a row is resolved with a running maximum (prefix scan) instead of a loop
+    global _scores
+    if _scores is None:
+        _scores = _score_table()
+    #both are cut to MAX_ALIGN_LENGTH, so the caller should pass targets of similar lengths (align_scores buckets them)
+    q = encode(query[:MAX_ALIGN_LENGTH])
+    if not len(targets) or not len(q):
+        return np.zeros(len(targets), dtype=np.int32)
+    targets = [t[:MAX_ALIGN_LENGTH] for t in targets]
+    n = max(max(len(t) for t in targets), 1)
+    padded = np.full((len(targets), n), PAD, dtype=np.uint8)
+    for row, target in enumerate(targets):
+        padded[row, :len(target)] = encode(target)
+    profile = _scores[q] #score of each query residue against every code
+
+    low = -(1 << 20)
+    steps = np.arange(n + 1, dtype=np.int32) * GAP_EXTEND
+    h_prev = np.zeros((len(targets), n + 1), dtype=np.int32)
+    f = np.full((len(targets), n + 1), low, dtype=np.int32)
+    h_pre = np.zeros((len(targets), n + 1), dtype=np.int32)
+    e = np.full((len(targets), n + 1), low, dtype=np.int32)
+    best = np.zeros(len(targets), dtype=np.int32)
+    for i in range(len(q)):
+        f = np.maximum(f - GAP_EXTEND, h_prev - GAP_OPEN - GAP_EXTEND) #gap in the target (vertical)
+        h_pre[:, 1:] = np.maximum(np.maximum(h_prev[:, :-1] + profile[i][padded], f[:, 1:]), 0)
+        #gap in the query (horizontal): E[j] = max over k < j of h_pre[k] - GAP_OPEN - GAP_EXTEND * (j - k)
+        running = np.maximum.accumulate(h_pre + steps, axis=1)
+        e[:, 1:] = running[:, :-1] - GAP_OPEN - steps[1:]
+        h_prev = np.maximum(h_pre, e)
+        np.maximum(best, h_prev.max(axis=1), out=best)
+    return best
+
+
+def _align_chunk(query, targets):
+    #process pool entry point
+    return smith_waterman_batch(query, targets).tolist()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    #one pool of worker processes per app, started the first time it is needed
+    #the workers are started with forkserver (spawn where there is none) - forking the GUI process itself would copy Tk and
+    #whatever locks its other threads happen to hold into every worker
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+def length_buckets(lengths, cells=BATCH_CELLS):
+    #splits target indexes into batches of similar length, shortest first - a batch is closed once it would pad more than
+    #cells residues or its longest target would be over twice its shortest, so padding never wastes much time or memory
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    buckets, bucket = [], []
+    for i in order:
+        length = max(min(lengths[i], MAX_ALIGN_LENGTH), 1)
+        if bucket and ((len(bucket) + 1) * length > cells or length > 2 * max(min(lengths[bucket[0]], MAX_ALIGN_LENGTH), 1)):
+            buckets.append(bucket)
+            bucket = []
+        bucket.append(i)
+    if bucket:
+        buckets.append(bucket)
+    return buckets
+
+
+def align_scores(query, targets, pool=None, token=None):
+    #Smith-Waterman scores for a list of targets, aligned in batches of similar length - big jobs run the batches in parallel
+    #token is a CancelToken checked between batches (SearchCancelled is raised, batches already sent to the pool are dropped)
+    if not targets:
+        return []
+    buckets = length_buckets([len(t) for t in targets])
+    scores = [0] * len(targets)
+    workers = os.cpu_count() or 1
+    cells = min(len(query), MAX_ALIGN_LENGTH) * sum(min(len(t), MAX_ALIGN_LENGTH) for t in targets)
+    if workers == 1 or cells < PARALLEL_CELLS:
+        for bucket in buckets:
+            if token is not None:
+                token.check()
+            for i, score in zip(bucket, smith_waterman_batch(query, [targets[i] for i in bucket]).tolist()):
+                scores[i] = score
+        return scores
+    pool = pool or get_process_pool()
+    futures = [pool.submit(_align_chunk, query, [targets[i] for i in bucket]) for bucket in buckets]
+    try:
+        for bucket, future in zip(buckets, futures):
+            for i, score in zip(bucket, wait_for(future, token)):
+                scores[i] = score
+    finally:
+        for future in futures:
+            future.cancel() #no-op for the ones that finished, the rest never start
+    return scores
+
+
+def sketch_many(sequences, pool=None, chunk_size=2000):
+    #sketches for a big list of sequences, chunk_size sequences per task across the process pool
+    if len(sequences) <= chunk_size or (os.cpu_count() or 1) == 1:
+        return sketch_batch(sequences)
+    pool = pool or get_process_pool()
+    parts = pool.map(sketch_batch, [sequences[i:i + chunk_size] for i in range(0, len(sequences), chunk_size)])
+    return np.concatenate(list(parts))
+
+
+class SimilarityIndex:
+    #persisted sketches of every sequence seen - sequences fetched from NCBI also keep their residues (compressed), since the
+    #cache can evict them, while imported ones are read back from their local FASTA file when they need rescoring
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sequences (id INTEGER PRIMARY KEY, accession TEXT UNIQUE, uid TEXT, title TEXT,"
+            " length INTEGER, source TEXT, sketch BLOB, residues BLOB)"
+        )
+        self._conn.commit()
+        self._matrix = None #(sequences x SKETCH_SIZE) sketches, loaded on first search
+        self._ids = None #row of the matrix -> sequences.id
+        self._pending = [] #(ids, sketches) added since the matrix was loaded
+        self._size = self._conn.execute("SELECT COUNT(*) FROM sequences").fetchone()[0]
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, accession):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM sequences WHERE accession = ?", (accession,)).fetchone() is not None
+
+    def add_records(self, records, source="ncbi", keep_residues=True, sketches=None):
+        #records are dicts with accession, residues and optionally uid/title - already indexed accessions are skipped
+        #sketches can be passed in when they were already worked out (e.g. by sketch_many) - returns how many were added
+        records = [r for r in records if r.get("accession")]
+        if sketches is None:
+            with self._lock:
+                known = {row[0] for row in self._conn.execute(
+                    f"SELECT accession FROM sequences WHERE accession IN ({','.join('?' * len(records))})",
+                    [r["accession"] for r in records]
+                )} if records else set()
+            records = [r for r in records if r["accession"] not in known]
+            sketches = sketch_batch([r["residues"] for r in records])
+        added_ids, added_rows = [], []
+        with self._lock:
+            for record, sketch in zip(records, sketches):
+                residues = zlib.compress(record["residues"].encode("ascii", "replace")) if keep_residues else None
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO sequences (accession, uid, title, length, source, sketch, residues)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (record["accession"], record.get("uid"), record.get("title", ""), len(record["residues"]), source,
+                     sketch.tobytes(), residues)
+                )
+                if cursor.rowcount:
+                    added_ids.append(cursor.lastrowid)
+                    added_rows.append(sketch)
+            self._conn.commit()
+            if added_ids and self._matrix is not None:
+                self._pending.append((np.array(added_ids, dtype=np.int64), np.array(added_rows, dtype=np.uint32)))
+            self._size += len(added_ids)
+        return len(added_ids)
+
+    def _load(self):
+        #caller holds the lock
+        if self._matrix is None:
+            ids, blobs = [], []
+            for row_id, blob in self._conn.execute("SELECT id, sketch FROM sequences ORDER BY id"):
+                ids.append(row_id)
+                blobs.append(blob)
+            self._ids = np.array(ids, dtype=np.int64)
+            self._matrix = np.frombuffer(b"".join(blobs), dtype=np.uint32).reshape(len(ids), SKETCH_SIZE)
+        if self._pending:
+            self._ids = np.concatenate([self._ids] + [ids for ids, _ in self._pending])
+            self._matrix = np.concatenate([self._matrix] + [rows for _, rows in self._pending])
+            self._pending = []
+        return self._ids, self._matrix
+
+    def search(self, residues, limit=20, exclude=None):
+        #sequences with the most k-mers in common with residues, best first - a list of dicts
+        #(accession, uid, title, length, source, similarity), exclude is an accession to leave out (usually the query itself)
+        sketch = sketch_batch([residues])[0]
+        with self._lock:
+            ids, matrix = self._load()
+            scores = similarities(matrix, sketch)
+            keep = min(limit + 1, len(scores))
+            if not keep:
+                return []
+            best = np.argpartition(-scores, keep - 1)[:keep]
+            best = best[np.argsort(-scores[best], kind="stable")]
+            best = [i for i in best if scores[i] > 0]
+            if not best:
+                return []
+            rows = {row[0]: row for row in self._conn.execute(
+                f"SELECT id, accession, uid, title, length, source FROM sequences WHERE id IN ({','.join('?' * len(best))})",
+                [int(ids[i]) for i in best]
+            )}
+        results = []
+        for i in best:
+            _, accession, uid, title, length, source = rows[int(ids[i])]
+            if accession != exclude:
+                results.append({"accession": accession, "uid": uid, "title": title, "length": length, "source": source,
+                                "similarity": float(scores[i])})
+        return results[:limit]
+
+    def residues(self, accessions):
+        #accession -> residues for the sequences whose residues are stored here (the fetched ones)
+        if not accessions:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT accession, residues FROM sequences WHERE residues IS NOT NULL AND accession IN ({','.join('?' * len(accessions))})",
+                list(accessions)
+            ).fetchall()
+        return {accession: zlib.decompress(blob).decode("ascii") for accession, blob in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,205 @@
+#type-ahead suggestions for the protein name field - a persisted prefix index of past searches that found something and of every
+#title the app has seen (fetched summaries and imported FASTA headers), so "hemo" can offer "hemoglobin subunit beta" before
+#anything goes to NCBI
+#every phrase is stored once, plus one row per word it can be matched from ("hemoglobin subunit beta", "subunit beta",
+#"beta"), so a lookup is a single range scan on the key index - a few ms even with hundreds of thousands of titles
+#lookups have their own connection (the file is in WAL mode) and bulk adds are committed in chunks, so typing never waits
+#for an import to finish adding its titles
+#RemoteSuggester adds NCBI's spelling correction and hit count for what is being typed, at most one request per interval
+import os
+import sqlite3
+import threading
+import time
+
+from title_index import STOP_WORDS
+
+
+DEFAULT_SUGGESTIONS_PATH = os.path.join(os.path.expanduser("~"), ".protein_app", "suggestions.sqlite3")
+MIN_PREFIX = 2 #shorter prefixes match too much to be useful
+MAX_WORD_STARTS = 4 #a phrase can be matched from its first few words, not every word of a long title
+MAX_PHRASE = 80 #longer titles are not useful as search terms
+SCAN_LIMIT = 2000 #title matches looked at per lookup, so a short prefix can't scan the whole index
+MAX_QUERIES = 5000 #most recent past searches kept in memory - these are always looked at, whatever the scan limit cuts off
+QUERY_WEIGHT = 5 #a past search counts as this many sightings of a title
+ADD_CHUNK = 2000 #phrases added per transaction
+
+QUERY, TITLE = "query", "title"
+
+
+def phrase_key(text):
+    #case folded with single spaces - "  Human   Insulin " and "human insulin" are one phrase
+    return " ".join(text.casefold().split())
+
+
+def word_starts(key):
+    #the keys a phrase is matched from - the whole phrase, then from each later word (stop words aren't worth starting from)
+    words = key.split(" ")
+    starts = [key]
+    for i in range(1, len(words)):
+        if len(starts) >= MAX_WORD_STARTS:
+            break
+        if words[i] not in STOP_WORDS and len(words[i]) >= MIN_PREFIX:
+            starts.append(" ".join(words[i:]))
+    return starts
+
+
+class SuggestionIndex:
+    def __init__(self, path=DEFAULT_SUGGESTIONS_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.RLock() #writer (re-entrant, since an in-memory index uses it as the read lock too)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL") #readers see the last commit and never wait for the writer
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS phrases (id INTEGER PRIMARY KEY, key TEXT UNIQUE, text TEXT, kind TEXT,"
+            " uses INTEGER, last_used REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS prefixes (key TEXT, phrase INTEGER, PRIMARY KEY (key, phrase)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+        if path == ":memory:": #an in-memory database can't be shared between connections
+            self._read_lock, self._reader = self._lock, self._conn
+        else:
+            self._read_lock = threading.Lock()
+            self._reader = sqlite3.connect(path, check_same_thread=False)
+        self._queries = None #key -> (text, uses, word starts) of past searches, loaded on the first lookup (under the read lock)
+
+    def __len__(self):
+        with self._read_lock:
+            return self._reader.execute("SELECT COUNT(*) FROM phrases").fetchone()[0]
+
+    def _add(self, phrases, kind, uses):
+        #a phrase seen again only gets its count bumped (and becomes a query once it has been searched), new ones also get their
+        #word start rows - returns how many were new
+        #each ADD_CHUNK phrases are one transaction, with the writer lock let go in between so add_query isn't held up either
+        phrases = list(phrases)
+        added = 0
+        for start in range(0, len(phrases), ADD_CHUNK):
+            with self._lock:
+                added += self._add_chunk(phrases[start:start + ADD_CHUNK], kind, uses)
+        return added
+
+    def _add_chunk(self, phrases, kind, uses):
+        #caller holds the writer lock
+        rows = {}
+        for text in phrases:
+            key = phrase_key(text)
+            if MIN_PREFIX <= len(key) <= MAX_PHRASE:
+                text = rows[key][0] if key in rows else " ".join(text.split())
+                rows[key] = (text, rows[key][1] + uses if key in rows else uses)
+        if not rows:
+            return 0
+        last_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM phrases").fetchone()[0]
+        now = time.time()
+        self._conn.executemany(
+            "INSERT INTO phrases (key, text, kind, uses, last_used) VALUES (?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET"
+            " uses = uses + excluded.uses, last_used = excluded.last_used,"
+            " kind = CASE WHEN excluded.kind = 'query' THEN 'query' ELSE kind END",
+            [(key, text, kind, count, now) for key, (text, count) in rows.items()]
+        )
+        new = self._conn.execute("SELECT id, key FROM phrases WHERE id > ?", (last_id,)).fetchall()
+        #sorted, so the rows go into the key index in order - much faster than random inserts for a big import
+        self._conn.executemany("INSERT OR IGNORE INTO prefixes VALUES (?, ?)",
+                               sorted((start, phrase) for phrase, key in new for start in word_starts(key)))
+        self._conn.commit()
+        if kind == QUERY:
+            updated = {key: self._conn.execute("SELECT text, uses FROM phrases WHERE key = ?", (key,)).fetchone() for key in rows}
+            with self._read_lock:
+                if self._queries is not None:
+                    for key, (text, total) in updated.items():
+                        self._queries[key] = (text, total, word_starts(key))
+        return len(new)
+
+    def _load_queries(self):
+        #caller holds the read lock
+        if self._queries is None:
+            self._queries = {
+                key: (text, uses, word_starts(key)) for key, text, uses in self._reader.execute(
+                    "SELECT key, text, uses FROM phrases WHERE kind = ? ORDER BY last_used DESC LIMIT ?", (QUERY, MAX_QUERIES)
+                )
+            }
+        return self._queries
+
+    def add_query(self, term):
+        #a search that found something - past searches rank above titles
+        self._add([term], QUERY, QUERY_WEIGHT)
+
+    def add_titles(self, titles):
+        #titles without the "[Organism]" part - returns how many were new
+        return self._add([title for title in titles if title], TITLE, 1)
+
+    def suggest(self, prefix, limit=8):
+        #up to limit suggestions for what has been typed so far, best first - phrases starting with the prefix come before ones
+        #where only a later word does, then past searches before titles, then the most used and the shortest
+        key = phrase_key(prefix)
+        if len(key) < MIN_PREFIX:
+            return []
+        with self._read_lock:
+            matches = {
+                phrase: (phrase, text, QUERY, uses) for phrase, (text, uses, starts) in self._load_queries().items()
+                if any(start.startswith(key) for start in starts)
+            }
+            for row in self._reader.execute(
+                "SELECT p.key, p.text, p.kind, p.uses FROM (SELECT DISTINCT phrase FROM prefixes WHERE key >= ? AND key < ? LIMIT ?) m"
+                " JOIN phrases p ON p.id = m.phrase", (key, key + "\uffff", SCAN_LIMIT)
+            ):
+                matches.setdefault(row[0], row)
+        rows = [r for r in matches.values() if r[0] != key] #what has already been typed in full is no suggestion
+        rows.sort(key=lambda r: (not r[0].startswith(key), r[2] != QUERY, -r[3], len(r[0])))
+        return [{"text": text, "kind": kind} for _, text, kind, _ in rows[:limit]]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+        if self._reader is not self._conn:
+            with self._read_lock:
+                self._reader.close()
+
+
+class RemoteSuggester:
+    #NCBI lookups for the term being typed, on a background thread - only the latest term is looked up, and never more than one
+    #request every interval seconds, so typing can't flood NCBI (or use up the rate limit a real search needs)
+    #lookup(term) does the network work and returns whatever should be passed to on_result(term, result)
+    def __init__(self, lookup, interval=1.0):
+        self.lookup = lookup
+        self.interval = interval
+        self._lock = threading.Condition()
+        self._pending = None #(term, on_result) waiting for its turn
+        self._last = 0.0
+        self._thread = None
+        self.requests = 0
+
+    def request(self, term, on_result):
+        #replaces whatever term was waiting - on_result is called on the background thread, and only if the lookup worked
+        with self._lock:
+            self._pending = (term, on_result)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="suggest")
+                self._thread.start()
+            self._lock.notify()
+
+    def cancel(self):
+        with self._lock:
+            self._pending = None
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while self._pending is None:
+                    self._lock.wait()
+                wait = self._last + self.interval - time.monotonic()
+                if wait > 0:
+                    self._lock.wait(wait) #a newer term typed meanwhile replaces this one
+                    continue
+                term, on_result = self._pending
+                self._pending = None
+                self._last = time.monotonic()
+                self.requests += 1
+            try:
+                result = self.lookup(term)
+            except Exception:
+                continue #suggestions are best effort, the search itself reports network errors
+            on_result(term, result)
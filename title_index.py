@@ -0,0 +1,289 @@
+#persisted inverted keyword index over the titles and organisms of every protein the app has seen (fetched summaries and
+#imported FASTA headers), so a free text name like "human hemoglobin" can be resolved offline instead of with esearch
+#each token maps to a sorted array of document numbers stored as one blob - a query walks the rarest token's documents in
+#ranking order (shortest title first) and binary searches the other lists, stopping as soon as it has enough matches, so
+#common words don't mean building sets of every document that has them - only words that are common but rarely together
+#fall back to intersecting the whole lists (C set operations)
+import bisect
+import heapq
+import math
+import os
+import re
+import sqlite3
+import threading
+from array import array
+
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".protein_app", "title_index.sqlite3")
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")
+ORGANISM_PREFIX = "org:" #organism words are indexed separately so "human" in a title and "Homo sapiens" filters don't mix
+QUERY_ORGANISM = re.compile(r"\[([^\]]+)\]\s*$") #"hemoglobin [Homo sapiens]" filters on organism, like NCBI titles are written
+DOC_BLOCK = 4096
+SCAN_LIMIT = 2000 #documents walked looking for matches before falling back to intersecting the whole lists
+RANK_INSERTS = 64 #new documents inserted into a token's ranking order one by one - past that it is sorted again when next needed
+STOP_WORDS = {"a", "an", "and", "the", "of", "in", "for", "to", "with", "protein"}
+
+#common names people type instead of the organism's latin name
+ORGANISM_ALIASES = {
+    "human": "homo sapiens", "mouse": "mus musculus", "rat": "rattus norvegicus", "yeast": "saccharomyces cerevisiae",
+    "cow": "bos taurus", "bovine": "bos taurus", "pig": "sus scrofa", "chicken": "gallus gallus",
+    "zebrafish": "danio rerio", "fly": "drosophila melanogaster", "e. coli": "escherichia coli",
+}
+
+
+def tokenize(text):
+    #lower case ("case folded") words, with very common words dropped unless they are the only thing there
+    tokens = TOKEN_PATTERN.findall(text.casefold())
+    kept = [t for t in tokens if t not in STOP_WORDS]
+    return kept or tokens
+
+
+def organism_tokens(organism):
+    organism = ORGANISM_ALIASES.get(organism.strip().casefold(), organism)
+    return [ORGANISM_PREFIX + t for t in TOKEN_PATTERN.findall(organism.casefold())]
+
+
+def parse_header(header):
+    #(accession, title, organism) from a FASTA header - understands NCBI "title [Organism]" and UniProt "title OS=Organism OX=..." styles
+    parts = header.strip().split(None, 1)
+    if not parts:
+        return "", "", ""
+    accession = parts[0]
+    if "|" in accession: #sp|P69905|HBA_HUMAN -> P69905
+        pieces = [p for p in accession.split("|") if p]
+        accession = pieces[1] if len(pieces) > 1 else pieces[0]
+    title = parts[1] if len(parts) > 1 else ""
+    organism = ""
+    if " OS=" in f" {title}":
+        title, _, rest = f" {title}".partition(" OS=")
+        organism = re.split(r" [A-Z]{2}=", rest, maxsplit=1)[0]
+        title = title.strip()
+    elif title.endswith("]") and "[" in title:
+        organism = title[title.rindex("[") + 1:-1]
+        title = title[:title.rindex("[")].strip()
+    return accession, title, organism
+
+
+def header_document(header):
+    #document dict for add_records from a FASTA header
+    accession, title, organism = parse_header(header)
+    return {"accession": accession, "title": title, "organism": organism}
+
+
+class TitleIndex:
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents (id INTEGER PRIMARY KEY, accession TEXT UNIQUE, uid TEXT,"
+            " title TEXT, organism TEXT, length INTEGER, source TEXT, n_tokens INTEGER)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS postings (token TEXT PRIMARY KEY, ids BLOB) WITHOUT ROWID")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS doc_tokens (block INTEGER PRIMARY KEY, counts BLOB)")
+        self._conn.commit()
+        self._postings = {} #token -> array of document ids, loaded on first use and kept up to date by add_records
+        self._ranked = {} #token -> the same ids shortest title first (then oldest), made the first time a query walks it
+        self._doc_tokens = None #document id -> number of distinct tokens (for ranking), stored in blocks of DOC_BLOCK documents
+        self._size = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def __len__(self):
+        return self._size
+
+    def _load(self, token):
+        #caller holds the lock
+        ids = self._postings.get(token)
+        if ids is None:
+            ids = array("I")
+            row = self._conn.execute("SELECT ids FROM postings WHERE token = ?", (token,)).fetchone()
+            if row is not None:
+                ids.frombytes(row[0])
+            self._postings[token] = ids
+        return ids
+
+    def _set_doc_tokens(self, doc, count):
+        #caller holds the lock
+        if doc >= len(self._doc_tokens):
+            self._doc_tokens.extend([0] * (doc + 1 - len(self._doc_tokens)))
+        self._doc_tokens[doc] = min(count, 65535)
+
+    def _load_doc_tokens(self):
+        #caller holds the lock
+        if self._doc_tokens is None:
+            self._doc_tokens = array("H")
+            for block, counts in self._conn.execute("SELECT block, counts FROM doc_tokens ORDER BY block"):
+                part = array("H")
+                part.frombytes(counts)
+                self._doc_tokens.extend([0] * (block * DOC_BLOCK - len(self._doc_tokens)))
+                self._doc_tokens.extend(part)
+        return self._doc_tokens
+
+    def add_records(self, records, source="ncbi"):
+        #records are dicts with accession/title/organism (and optionally uid, length) - already indexed accessions are skipped,
+        #so this can be called with every esummary reply and every imported file - returns how many new documents were added
+        new_postings = {}
+        added = 0
+        with self._lock:
+            self._load_doc_tokens()
+            for record in records:
+                accession = record.get("accession")
+                if not accession:
+                    continue
+                title, organism = record.get("title", ""), record.get("organism", "")
+                tokens = set(tokenize(title)) | set(organism_tokens(organism))
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO documents (accession, uid, title, organism, length, source, n_tokens)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (accession, record.get("uid"), title, organism, record.get("length"), source, len(tokens))
+                )
+                if cursor.rowcount == 0:
+                    continue
+                added += 1
+                for token in tokens:
+                    new_postings.setdefault(token, []).append(cursor.lastrowid)
+                self._set_doc_tokens(cursor.lastrowid, len(tokens))
+            for token, doc_ids in new_postings.items():
+                ids = self._load(token)
+                ids.extend(doc_ids) #new documents always get bigger ids, so the list stays sorted
+                ranked = self._ranked.get(token)
+                if ranked is not None and len(doc_ids) <= RANK_INSERTS:
+                    for doc in doc_ids: #after the documents of the same size, which all have smaller ids
+                        bisect.insort(ranked, doc, key=self._doc_tokens.__getitem__)
+                elif ranked is not None:
+                    del self._ranked[token]
+                self._conn.execute("INSERT OR REPLACE INTO postings VALUES (?, ?)", (token, ids.tobytes()))
+            #only the blocks of document sizes that changed are written back
+            for block in {doc // DOC_BLOCK for doc_ids in new_postings.values() for doc in doc_ids}:
+                counts = self._doc_tokens[block * DOC_BLOCK:(block + 1) * DOC_BLOCK]
+                self._conn.execute("INSERT OR REPLACE INTO doc_tokens VALUES (?, ?)", (block, counts.tobytes()))
+            self._conn.commit()
+            self._size += added
+        return added
+
+    def search(self, query, organism=None, limit=20):
+        #ranked documents matching every word of the query - "hemoglobin [Homo sapiens]", "human hemoglobin" or organism="human"
+        #filter on organism - returns a list of dicts (accession, uid, title, organism, length, score), best first
+        match = QUERY_ORGANISM.search(query)
+        if match and organism is None:
+            organism, query = match.group(1), query[:match.start()]
+        words = list(dict.fromkeys(tokenize(query)))
+        if organism is None:
+            for word in words:
+                if word in ORGANISM_ALIASES and len(words) > 1: #"human hemoglobin" - human is the organism, not a title word
+                    organism = word
+                    words.remove(word)
+                    break
+        org_words = organism_tokens(organism) if organism else []
+        if not words and not org_words:
+            return []
+        with self._lock:
+            #a query word can match either the title or the organism ("hemoglobin sapiens")
+            word_lists = {w: (self._load(w), self._load(ORGANISM_PREFIX + w)) for w in words}
+            org_lists = [self._load(t) for t in org_words]
+            if any(len(ids) == 0 for ids in org_lists):
+                return [] #nothing from that organism at all
+            total = max(self._size, 1)
+            idf = {w: math.log(1 + total / (len(title) + len(org) or 1)) for w, (title, org) in word_lists.items()}
+
+            doc_tokens = self._load_doc_tokens()
+
+            def organism_docs():
+                #documents from the organism, None when there is no organism filter
+                docs = None
+                for ids in sorted(org_lists, key=len):
+                    docs = set(ids) if docs is None else _intersect(docs, ids)
+                return docs
+
+            #every word must match (in the title or the organism), and the organism filter too - documents that do all have the
+            #same weight, so the best are just the shortest titles
+            groups = [(w, ORGANISM_PREFIX + w) for w in words] + [(t,) for t in org_words]
+            best = self._first_matches(groups, limit)
+            if best is None:
+                #common words that are rarely together - start from the rarest word's documents and keep only those the next
+                #rarest has, and so on
+                matches = organism_docs()
+                for word in sorted(words, key=lambda w: len(word_lists[w][0]) + len(word_lists[w][1])):
+                    title, org = word_lists[word]
+                    if matches is None:
+                        matches = set(title).union(org)
+                    else:
+                        matches = _intersect(matches, title) | _intersect(matches, org)
+                    if not matches:
+                        break
+                best = heapq.nsmallest(limit, sorted(matches), key=doc_tokens.__getitem__) #sorted, as ties go to the oldest
+            weight = dict.fromkeys(best, sum(idf.values()))
+            if not weight and words:
+                #nothing has all the words - fall back to documents with the rarer ones (the organism filter still applies)
+                in_organism = organism_docs()
+                for word in words:
+                    title = word_lists[word][0]
+                    for doc in (title if in_organism is None else _intersect(in_organism, title)):
+                        weight[doc] = weight.get(doc, 0) + idf[word]
+                #shorter titles that match the same words are more specific, so the weight is divided by the title's size
+                best = heapq.nlargest(limit, weight, key=lambda doc: weight[doc] / math.sqrt(max(doc_tokens[doc], 1)))
+            if not best:
+                return []
+            rows = {row[0]: row for row in self._conn.execute(
+                f"SELECT id, accession, uid, title, organism, length FROM documents WHERE id IN ({','.join('?' * len(best))})", best
+            )}
+        results = []
+        for doc in best:
+            _, accession, uid, title, doc_organism, length = rows[doc]
+            results.append({"accession": accession, "uid": uid, "title": title, "organism": doc_organism, "length": length,
+                            "score": weight[doc] / math.sqrt(max(doc_tokens[doc], 1))})
+        return results
+
+    def _ranked_ids(self, token):
+        #caller holds the lock (and has loaded the document sizes)
+        ranked = self._ranked.get(token)
+        if ranked is None:
+            ranked = self._ranked[token] = array("I", sorted(self._load(token), key=self._doc_tokens.__getitem__))
+        return ranked
+
+    def _first_matches(self, groups, limit):
+        #caller holds the lock - groups are tuples of tokens, a document matches if every group has one of its tokens
+        #returns the first limit matches in ranking order (shortest title, then oldest), walking the rarest group's documents
+        #in that order and binary searching the other lists - None if SCAN_LIMIT documents didn't turn up limit matches
+        sizes = [sum(len(self._load(t)) for t in group) for group in groups]
+        rarest = groups[sizes.index(min(sizes))]
+        others = [[self._load(t) for t in group if len(self._load(t))] for group in groups if group is not rarest]
+        rank = self._doc_tokens.__getitem__
+        walk = heapq.merge(*(self._ranked_ids(t) for t in rarest), key=lambda doc: (rank(doc), doc))
+        found = []
+        last = None
+        for scanned, doc in enumerate(walk):
+            if doc == last:
+                continue #in the title and the organism
+            last = doc
+            if scanned >= SCAN_LIMIT:
+                return None
+            if all(any(_contains(ids, doc) for ids in group) for group in others):
+                found.append(doc)
+                if len(found) == limit:
+                    break
+        return found
+
+    def titles(self):
+        #every distinct title in the index
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT title FROM documents") if row[0]]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _intersect(docs, ids):
+    #the documents in the set docs that are also in the sorted array ids - a few documents are binary searched, more than
+    #that and the whole array is run through the set in C, which is faster than a binary search per document
+    if len(docs) * 16 < len(ids):
+        return {doc for doc in docs if _contains(ids, doc)}
+    return docs.intersection(ids)
+
+
+def _contains(ids, doc):
+    #binary search in a sorted array of document ids
+    i = bisect.bisect_left(ids, doc)
+    return i < len(ids) and ids[i] == doc
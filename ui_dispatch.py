@@ -0,0 +1,65 @@
+#GUI updates from worker threads - Tk widgets may only be touched on the main thread, so instead of every worker calling
+#root.after(0, ...) for each progress tick or status change (one Tk event each, which floods the event queue when many jobs
+#report at once), workers post callbacks here and the main loop runs them in one batch per frame
+#an update posted with a key (e.g. "progress" or "status") replaces the one with the same key still waiting, so a frame only
+#draws the latest value of each widget however many jobs are reporting
+import sys
+import threading
+
+
+FRAME_MS = 33 #~30 frames per second
+
+
+class UIDispatcher:
+    def __init__(self, root, frame_ms=FRAME_MS):
+        self.root = root
+        self.frame_ms = frame_ms
+        self._lock = threading.Lock()
+        self._pending = {} #sequence number -> callback, in the order they were posted
+        self._keyed = {} #key -> sequence number of the keyed callback waiting to run
+        self._next = 0
+        self._job = None
+        self.posted = 0
+        self.merged = 0 #keyed updates that were replaced by a newer one before they ran
+        self.frames = 0 #frames that had anything to run
+
+    def post(self, callback, key=None):
+        #callable from any thread - callback runs on the main thread at the next frame
+        with self._lock:
+            self.posted += 1
+            if key is not None:
+                old = self._keyed.pop(key, None)
+                if old is not None:
+                    del self._pending[old]
+                    self.merged += 1
+                self._keyed[key] = self._next
+            self._pending[self._next] = callback
+            self._next += 1
+
+    def start(self):
+        #main thread only
+        if self._job is None:
+            self._job = self.root.after(self.frame_ms, self._drain)
+
+    def stop(self):
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+
+    def _drain(self):
+        with self._lock:
+            callbacks = list(self._pending.values())
+            self._pending.clear()
+            self._keyed.clear()
+        if callbacks:
+            self.frames += 1
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                self.root.report_callback_exception(*sys.exc_info()) #as Tk would for an after callback, and carry on with the rest
+        self._job = self.root.after(self.frame_ms, self._drain)
+
+    def stats(self):
+        with self._lock:
+            return {"posted": self.posted, "merged": self.merged, "frames": self.frames, "waiting": len(self._pending)}